@@ -1,11 +1,18 @@
+from collections.abc import Collection, Iterable
 from pathlib import Path
 from typing import Optional
 from typing_extensions import Self
+import pandas as pd
+from pydantic import PrivateAttr
 from pydantic_xml import BaseXmlModel, element  # , attr
 from auto_bpsm.file_formats.lithology_extras.meta import Meta, MetaParameter, MetaParameterGroup
 from auto_bpsm.file_formats.lithology_extras.curve import CurveGroup, Curve
-from auto_bpsm.file_formats.lithology_extras.litho import LithologyGroup, Lithology, MainLithologyGroup
-from auto_bpsm.utilities import decode_id_and_name, generate_new_id, items_lookup_return, num_string_convert
+from auto_bpsm.file_formats.lithology_extras.litho import LithologyGroup, Lithology, MainLithologyGroup, Parameter
+from auto_bpsm.file_formats.lithology_extras.index import CatalogueIndex
+from auto_bpsm.file_formats.lithology_extras.tree import CatalogueTree
+from auto_bpsm.utilities import decode_id_and_name, generate_new_id, items_lookup_return, num_string_convert, write_atomic
+
+VARIANT_NAME_SEPARATOR = "_"
 
 
 class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
@@ -18,66 +25,114 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
     curve_groups: list[CurveGroup] = element(tag="CurveGroup")
     main_lithology_groups: list[MainLithologyGroup] = element(tag="LithologyGroup")
 
+    _index: Optional[CatalogueIndex] = PrivateAttr(default=None)
+    _tree: Optional[CatalogueTree] = PrivateAttr(default=None)
+    _is_partial: bool = PrivateAttr(default=False)
+
     class Config:
         underscore_attrs_are_private = True
 
+    @property
+    def index(self) -> CatalogueIndex:
+        """Returns the lookup indexes, built on first use and kept up to date by the catalogue methods only"""
+        if self._index is None:
+            self._index = CatalogueIndex.build(self)
+        return self._index
+
+    def rebuild_index(self) -> None:
+        """Rebuilds the lookup indexes, needed after adding, removing or renaming nodes without the catalogue methods"""
+        self._index = CatalogueIndex.build(self)
+
+    def copy(self, **kwargs) -> Self:
+        """Copies the catalogue, the copy builds its own lookup indexes"""
+        # A deep copy copies the indexes apart from the nodes, so they would point to the original nodes
+        catalogue = super().copy(**kwargs)
+        catalogue._index = None
+        if catalogue._tree is not None and catalogue._tree is not self._tree:
+            catalogue.track_edits([catalogue, catalogue.meta])
+        return catalogue
+
+    @property
+    def is_partial(self) -> bool:
+        """Checks if only some lithologies were read from the file"""
+        return self._is_partial
+
+    def track_edits(self, nodes: Iterable[BaseXmlModel]) -> None:
+        """Marks nodes as edited, needed before editing nodes not returned by the getters for incremental writes"""
+        if self._tree is None:
+            return
+        for node in nodes:
+            if node is not None:
+                self._tree.track(node)
+
+    def is_saved(self, nodes: list[BaseXmlModel] = None) -> bool:
+        """Checks if the nodes, or all the nodes handed out for editing, are as they were last read or written"""
+        if self._tree is None:
+            return False
+        if nodes is None:
+            nodes = list(self._tree.tracked_nodes.values())
+        return not any([self._tree.is_changed(node) for node in nodes])
+
     @property
     def lithology_ids(self):
         """Returns all the ids of the lithology in the lithology groups"""
-        ids = []
-        for main_lithology_group in self.main_lithology_groups:
-            ids.extend(main_lithology_group.lithology_ids)
-        return ids
+        return list(self.index.lithologies_by_id)
 
     @property
     def lithology_group_ids(self):
         """Returns all the ids in the lithology groups"""
-        ids = []
-        for main_lithology_group in self.main_lithology_groups:
-            ids.extend(main_lithology_group.lithology_group_ids)
-        return ids
+        return list(self.index.lithology_groups_by_id)
 
     @property
     def main_lithology_group_ids(self):
         """Return all the ids for main lithology groups"""
-        ids = []
-        for main_lithology_group in self.main_lithology_groups:
-            ids.append(main_lithology_group.id)
-        return ids
+        return list(self.index.main_lithology_groups_by_id)
 
     @property
     def curve_ids(self):
         """Returns all the ids of the curves in the curve group"""
-        ids = []
-        for curve_group in self.curve_groups:
-            ids.extend(curve_group.curve_ids)
-        return ids
+        return list(self.index.curves_by_id)
 
     @staticmethod
-    def read_catalogue_file(filename: Path) -> Self:
-        """Reads the file"""
-        with open(filename, "r", encoding="utf-8") as f:
-            raw_xml = f.read()
-        catalogue = LithologyCatalogue.from_xml(raw_xml)
+    def read_catalogue_file(filename: Path, lithologies: Optional[Collection[str]] = None) -> Self:
+        """Reads the file, only the given lithologies (names or ids) and what they reference if provided"""
+        # The tree is kept for incremental writes, the nodes handed out are compared to their state when read
+        tree = CatalogueTree(filename)
+        if lithologies is None:
+            catalogue = LithologyCatalogue.from_xml_tree(tree.read())
+        else:
+            catalogue = LithologyCatalogue.from_xml_tree(tree.select_lithologies(lithologies))
+            catalogue._is_partial = True
+        tree.saved_keys = CatalogueTree.get_keys(catalogue)
+        catalogue._tree = tree
+        catalogue.track_edits([catalogue, catalogue.meta])
+        catalogue.rebuild_index()
         return catalogue
 
-    def write_catalogue_file(self, filename: Path):
-        """Writes the catalogue"""
-        xml_byte = self.to_xml(skip_empty=True, pretty_print=True, encoding="utf-8")
-        xml_string = xml_byte.decode(encoding="utf-8")
-        xml_string = xml_string.replace("&gt;", ">")
-        xml_string = xml_string.replace("&lt;", "<")
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(xml_string)
+    def write_catalogue_file(self, filename: Path, incremental: bool = False):
+        """Writes the catalogue, incremental patches the nodes that changed since they were read into the read file"""
+        # The parts that were not read are only in the tree
+        if (incremental or self._is_partial) and self._tree is not None:
+            self._tree.apply_changes()
+        else:
+            if self._tree is None:
+                self._tree = CatalogueTree(filename)
+                self.track_edits([self, self.meta])
+            self._tree.set_root(self)
+
+        # Serialized once, the values are escaped by lxml
+        write_atomic(filename, self._tree.to_string())
+        self._tree.finish_write(filename)
 
     def get_main_lithology_groups(self, identifier: str, is_unique: bool = False):
         """Gets the lithology group"""
         id, name = decode_id_and_name(identifier)
-
-        found_lithologies_group = []
-        for main_lithology_group in self.main_lithology_groups:
-            if main_lithology_group.name == name or main_lithology_group.id == id:
-                found_lithologies_group.append(main_lithology_group)
+        if id is not None:
+            main_lithology_group = self.index.main_lithology_groups_by_id.get(id)
+            found_lithologies_group = [main_lithology_group] if main_lithology_group is not None else []
+        else:
+            found_lithologies_group = list(self.index.main_lithology_groups_by_name.get(name, []))
+        self.track_edits(found_lithologies_group)
         return items_lookup_return(found_lithologies_group, is_unique)
 
     def get_main_lithology_group(self, identifier: str) -> MainLithologyGroup:
@@ -86,9 +141,14 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
 
     def get_lithology_groups(self, identifier: str, is_unique: bool = False):
         """Get the lithology group"""
-        found_lithology_group = []
-        for main_lithology_group in self.main_lithology_groups:
-            found_lithology_group.extend(main_lithology_group.get_lithology_groups(identifier, False))
+        id, name = decode_id_and_name(identifier)
+        if id is not None:
+            entry = self.index.lithology_groups_by_id.get(id)
+            entries = [entry] if entry is not None else []
+        else:
+            entries = self.index.lithology_groups_by_name.get(name, [])
+        found_lithology_group = [list(entry) for entry in entries]
+        self.track_edits([node for entry in entries for node in entry])
         return items_lookup_return(found_lithology_group, is_unique)
 
     def get_lithology_group(self, identifier: str):
@@ -97,9 +157,14 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
 
     def get_lithologies(self, identifier: str) -> list[tuple[Lithology, LithologyGroup, MainLithologyGroup]]:
         """retrieves a lithology by its name or id"""
-        found_lithologies = []
-        for main_lithology_group in self.main_lithology_groups:
-            found_lithologies.extend(main_lithology_group.get_lithologies(identifier, False))
+        id, name = decode_id_and_name(identifier)
+        if id is not None:
+            entry = self.index.lithologies_by_id.get(id)
+            entries = [entry] if entry is not None else []
+        else:
+            entries = self.index.lithologies_by_name.get(name, [])
+        found_lithologies = [list(entry) for entry in entries]
+        self.track_edits([node for entry in entries for node in entry])
         return found_lithologies
 
     def get_lithology(
@@ -115,9 +180,14 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         identifier: str,
     ) -> list[tuple[Curve, CurveGroup]]:
         """returns a curve using the curve name"""
-        found_curves = []
-        for curve_group in self.curve_groups:
-            found_curves.extend(curve_group.get_curves(identifier, False))
+        id, name = decode_id_and_name(identifier)
+        if id is not None:
+            entry = self.index.curves_by_id.get(id)
+            entries = [entry] if entry is not None else []
+        else:
+            entries = self.index.curves_by_name.get(name, [])
+        found_curves = [list(entry) for entry in entries]
+        self.track_edits([node for entry in entries for node in entry])
         return found_curves
 
     def get_curve(
@@ -130,24 +200,21 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
 
     def get_curve_group_for_curve(self, curve: Curve) -> CurveGroup:
         """Return the curve group for the curve"""
-        found_curve_groups = []
-        for curve_group in self.curve_groups:
-            if curve_group.contains_curve(curve):
-                found_curve_groups.append(curve_group)
+        entry = self.index.curves_by_id.get(curve.id)
+        found_curve_groups = [entry[1]] if entry is not None and entry[0] is curve else []
+        self.track_edits(found_curve_groups)
         return items_lookup_return(found_curve_groups, True)
 
     def get_lithology_group_for_lithology(self, lithology: Lithology):
-        found_lithology_groups = []
-        for main_lithology_group in self.main_lithology_groups:
-            lithology_groups = main_lithology_group.get_lithology_groups_for_lithology(lithology)
-            found_lithology_groups.extend(lithology_groups)
+        entry = self.index.lithologies_by_id.get(lithology.id)
+        found_lithology_groups = [[entry[1], entry[2]]] if entry is not None and entry[0] is lithology else []
+        self.track_edits([node for nodes in found_lithology_groups for node in nodes])
         return items_lookup_return(found_lithology_groups, True)
 
     def get_main_lithology_group_for_lithology_group(self, lithology_group: LithologyGroup) -> MainLithologyGroup:
-        found_main_lithology_groups = []
-        for main_lithology_group in self.main_lithology_groups:
-            if main_lithology_group.contains_lithology_group(lithology_group):
-                found_main_lithology_groups.append(main_lithology_group)
+        entry = self.index.lithology_groups_by_id.get(lithology_group.id)
+        found_main_lithology_groups = [entry[1]] if entry is not None and entry[0] is lithology_group else []
+        self.track_edits(found_main_lithology_groups)
         return items_lookup_return(found_main_lithology_groups, True)
 
     def get_meta_parameter_group(
@@ -156,16 +223,12 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         name: Optional[str] = None,
     ) -> MetaParameterGroup:
         """Gets the meta parameter group"""
-        to_search = self.meta.meta_parameter_groups.copy()
-
-        found_mpg = []
-        while len(to_search) > 0:
-            meta_parameter_group = to_search.pop()
-            if meta_parameter_group.name == name or meta_parameter_group.id == id:
-                found_mpg.append(meta_parameter_group)
-            if meta_parameter_group.meta_parameter_groups is not None:
-                to_search.extend(meta_parameter_group.meta_parameter_groups)
+        found_mpg = list(self.index.meta_parameter_groups_by_name.get(name, []))
+        meta_parameter_group = self.index.meta_parameter_groups_by_id.get(id)
+        if meta_parameter_group is not None and all([mpg is not meta_parameter_group for mpg in found_mpg]):
+            found_mpg.append(meta_parameter_group)
 
+        self.track_edits(found_mpg)
         n_mpg_found = len(found_mpg)
         if n_mpg_found == 0:
             return None, None
@@ -180,19 +243,12 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         name: Optional[str] = None,
     ) -> tuple[MetaParameter, MetaParameterGroup]:
         """Get meta parameter"""
+        found_mp = list(self.index.meta_parameters_by_name.get(name, []))
+        entry = self.index.meta_parameters_by_id.get(id)
+        if entry is not None and all([mp[0] is not entry[0] for mp in found_mp]):
+            found_mp.append(entry)
 
-        to_search = self.meta.meta_parameter_groups.copy()
-
-        found_mp = []
-        while len(to_search) > 0:
-            meta_parameter_group = to_search.pop()
-            if meta_parameter_group.meta_parameters is not None:
-                for meta_parameter in meta_parameter_group.meta_parameters:
-                    if meta_parameter.name == name or meta_parameter.id == id:
-                        found_mp.append((meta_parameter, meta_parameter_group))
-            if meta_parameter_group.meta_parameter_groups is not None:
-                to_search.extend(meta_parameter_group.meta_parameter_groups)
-
+        self.track_edits([node for entry in found_mp for node in entry])
         n_mp_found = len(found_mp)
         if n_mp_found == 0:
             return None, None
@@ -204,7 +260,7 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
     def get_lithology_parameter(self, lithology: str | Lithology, parameter_name: str):
         """Get lithology parameter"""
         if isinstance(lithology, str):
-            lithology, _, _ = self.get_lithology(lithology_name=lithology)
+            lithology, _, _ = self.get_lithology(lithology)
         meta_parameter, _meta_parameter_group = self.get_meta_parameter(name=parameter_name)
         parameter = lithology.get_parameter(meta_parameter.id)
 
@@ -234,11 +290,61 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         for parameter_name, value in parameter_dict.items():
             meta_parameter, _meta_parameter_group = self.get_meta_parameter(name=parameter_name)
             parameter = lithology.get_parameter(id=meta_parameter.id)
-            if parameter.is_curve:
-                curve, curve_group = self.get_curve(id=parameter.meta_parameter_id)
-                curve.set_curve_table(value)
-            else:
-                parameter.value = str(value)
+            self.set_parameter_value(lithology, parameter, value)
+
+    def update_lithology_parameters(self, parameters_table: pd.DataFrame) -> None:
+        """Update many lithologies at once from a table of lithologies (rows) by parameter names (columns)"""
+        # Resolve the meta parameters once for all the lithologies
+        meta_parameter_ids = []
+        for parameter_name in parameters_table.columns:
+            meta_parameter, _meta_parameter_group = self.get_meta_parameter(name=parameter_name)
+            if meta_parameter is None:
+                raise LookupError(f"Parameter {parameter_name} was not found")
+            meta_parameter_ids.append(meta_parameter.id)
+
+        values_table = parameters_table.to_numpy(dtype=object)
+        for lithology, values in zip(parameters_table.index, values_table):
+            if not isinstance(lithology, Lithology):
+                lithology, _lithology_group, _main_lithology_group = self.get_lithology(lithology)
+
+            # One pass over the parameter groups of the lithology
+            parameters = {}
+            for parameter_group in lithology.parameter_groups:
+                for parameter in parameter_group.parameters:
+                    parameters.setdefault(parameter.meta_parameter_id, parameter)
+
+            for parameter_name, meta_parameter_id, value in zip(parameters_table.columns, meta_parameter_ids, values):
+                # Missing values are left unchanged
+                if pd.api.types.is_scalar(value) and pd.isna(value):
+                    continue
+                if meta_parameter_id not in parameters:
+                    raise LookupError(f"Lithology {lithology.name} has no parameter {parameter_name}")
+                self.set_parameter_value(lithology, parameters[meta_parameter_id], value)
+
+    def set_parameter_value(self, lithology: Lithology, parameter: Parameter, value) -> None:
+        """Sets a parameter value, curve parameters update the curve they point to"""
+        self.track_edits([lithology])
+        if parameter.is_curve:
+            curve, _curve_group = self.get_curve(parameter.value)
+            curve.set_curve_table(value)
+        else:
+            parameter.value = str(value)
+
+    def scale_curves(self, curves: list[str | Curve], x_factor: float = 1.0, y_factor: float = 1.0) -> None:
+        """Multiplies the x and y values of several curves"""
+        for curve in curves:
+            if isinstance(curve, str):
+                curve, _curve_group = self.get_curve(curve)
+            self.track_edits([curve])
+            curve.scale(x_factor, y_factor)
+
+    def shift_curves(self, curves: list[str | Curve], x_offset: float = 0.0, y_offset: float = 0.0) -> None:
+        """Adds to the x and y values of several curves"""
+        for curve in curves:
+            if isinstance(curve, str):
+                curve, _curve_group = self.get_curve(curve)
+            self.track_edits([curve])
+            curve.shift(x_offset, y_offset)
 
     def duplicate_curve(
         self,
@@ -251,12 +357,14 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
             source_curve, curve_group = self.get_curve(source_curve)
         new_curve = source_curve.copy(deep=True)
         new_curve.name = new_curve_name
-        new_curve.id = generate_new_id(self.curve_ids)
+        new_curve.id = generate_new_id(self.index.curves_by_id)
 
         # Add to curve group
         if curve_group is None:
             curve_group = self.get_curve_group_for_curve(source_curve)
+        self.track_edits([curve_group])
         curve_group.curves.append(new_curve)
+        self.index.add_curve(new_curve, curve_group)
         return new_curve
 
     def duplicate_lithology(
@@ -268,25 +376,82 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
     ):
         """Duplicate a lithology"""
         if isinstance(source_lithology, str):
-            id, name = decode_id_and_name(source_lithology)
-            source_lithology, lithology_group = self.get_lithology(id=id, name=name)
+            source_lithology, _source_lithology_group, _main_lithology_group = self.get_lithology(source_lithology)
+        if isinstance(lithology_group, str):
+            lithology_group, _main_lithology_group = self.get_lithology_group(lithology_group)
 
         new_lithology = source_lithology.copy(deep=True)
         new_lithology.name = new_lithology_name
-        new_lithology.id = generate_new_id(self.lithology_ids)
+        new_lithology.id = generate_new_id(self.index.lithologies_by_id)
         new_lithology.readonly = not modifiable
 
-        # Create new curves
+        # Create new curves, once for curves used by several parameters
+        new_curves = {}
         for parameter_group in new_lithology.parameter_groups:
             for parameter in parameter_group.parameters:
-                if parameter.is_curve:
-                    pass
+                if not parameter.is_curve or parameter.value not in self.index.curves_by_id:
+                    continue
+                if parameter.value not in new_curves:
+                    source_curve, curve_group = self.get_curve(parameter.value)
+                    new_curve_name = f"{source_curve.name} ({new_lithology_name})"
+                    new_curves[parameter.value] = self.duplicate_curve(source_curve, new_curve_name, curve_group)
+                parameter.value = new_curves[parameter.value].id
 
         if lithology_group is None:
             lithology_group, _main_lithology_group = self.get_lithology_group_for_lithology(source_lithology)
+        self.track_edits([lithology_group])
         lithology_group.lithologies.append(new_lithology)
+        main_lithology_group = self.get_main_lithology_group_for_lithology_group(lithology_group)
+        self.index.add_lithology(new_lithology, lithology_group, main_lithology_group)
         return new_lithology
 
+    def create_lithology_variants(
+        self,
+        lithologies: list[str | Lithology],
+        realization_names: list[str],
+    ) -> dict[str, list[tuple[Lithology, Lithology]]]:
+        """Creates a copy of the lithologies, with their own curves, for each realization"""
+        source_lithologies = [
+            self.get_lithology(lithology)[0] if isinstance(lithology, str) else lithology for lithology in lithologies
+        ]
+
+        variants = {}
+        for realization_name in realization_names:
+            lithology_pairs = []
+            for source_lithology in source_lithologies:
+                variant_name = f"{source_lithology.name}{VARIANT_NAME_SEPARATOR}{realization_name}"
+                lithology_pairs.append((source_lithology, self.duplicate_lithology(source_lithology, variant_name)))
+
+            # Mixed variants use the variants of their components
+            variant_ids = {source_lithology.id: variant.id for source_lithology, variant in lithology_pairs}
+            for _source_lithology, variant in lithology_pairs:
+                if variant.mixing is None:
+                    continue
+                for lithology_component in variant.mixing.lithology_components:
+                    lithology_component.id = variant_ids.get(lithology_component.id, lithology_component.id)
+            variants[realization_name] = lithology_pairs
+        return variants
+
+    def delete_lithology_variants(self, variants: dict[str, list[tuple[Lithology, Lithology]]]) -> None:
+        """Deletes the variants of create_lithology_variants and the curves no other lithology uses"""
+        curve_ids = set()
+        for lithology_pairs in variants.values():
+            for _source_lithology, variant in lithology_pairs:
+                # Looked up by id as the variants may come from another read of the catalogue
+                if variant.id not in self.index.lithologies_by_id:
+                    continue
+                variant, _lithology_group, _main_lithology_group = self.index.lithologies_by_id[variant.id]
+                for parameter_group in variant.parameter_groups:
+                    curve_ids.update([parameter.value for parameter in parameter_group.parameters if parameter.is_curve])
+                self.delete_lithology(variant)
+
+        for lithology, _lithology_group, _main_lithology_group in self.index.lithologies_by_id.values():
+            for parameter_group in lithology.parameter_groups:
+                curve_ids.difference_update([parameter.value for parameter in parameter_group.parameters])
+        for curve_id in curve_ids:
+            if curve_id in self.index.curves_by_id:
+                self.delete_curve(curve_id)
+
     def create_lithology_group(
         self,
         source_lithology_group: str | LithologyGroup,
@@ -302,15 +467,17 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         if main_lithology_group is None:
             main_lithology_group = self.get_main_lithology_group_for_lithology_group(source_lithology_group)
         if isinstance(main_lithology_group, str):
-            main_lithology_group, _ = self.get_lithology_group(main_lithology_group)
+            main_lithology_group = self.get_main_lithology_group(main_lithology_group)
+        self.track_edits([main_lithology_group])
 
         new_lithology_group = source_lithology_group.copy()
         new_lithology_group.name = new_name
-        new_lithology_group.lithologies = None
+        new_lithology_group.lithologies = []
         new_lithology_group.readonly = False
-        new_lithology_group.id = generate_new_id(self.lithology_group_ids)
+        new_lithology_group.id = generate_new_id(self.index.lithology_groups_by_id)
 
         main_lithology_group.lithology_groups.append(new_lithology_group)
+        self.index.add_lithology_group(new_lithology_group, main_lithology_group)
         return new_lithology_group
 
     def create_main_lithology_group(
@@ -323,11 +490,12 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
             source_main_lithology_group = self.get_main_lithology_group(source_main_lithology_group)
 
         new_main_lithology_group = source_main_lithology_group.copy()
-        new_main_lithology_group.id = generate_new_id(existing_ids=self.main_lithology_group_ids)
-        new_main_lithology_group.lithology_groups = None
+        new_main_lithology_group.id = generate_new_id(existing_ids=self.index.main_lithology_groups_by_id)
+        new_main_lithology_group.lithology_groups = []
         new_main_lithology_group.name = new_name
         new_main_lithology_group.readonly = False
         self.main_lithology_groups.append(new_main_lithology_group)
+        self.index.add_main_lithology_group(new_main_lithology_group)
         return new_main_lithology_group
 
     def delete_main_lithology_group(self, main_lithology_group: MainLithologyGroup | str) -> None:
@@ -335,6 +503,7 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
         if isinstance(main_lithology_group, str):
             main_lithology_group = self.get_main_lithology_group(main_lithology_group)
         self.main_lithology_groups.remove(main_lithology_group)
+        self.index.remove_main_lithology_group(main_lithology_group)
 
     def delete_lithology_group(self, lithology_group: LithologyGroup | str) -> None:
         """Deletes a lithology group"""
@@ -344,12 +513,24 @@ class LithologyCatalogue(BaseXmlModel, tag="Catalogue"):
             main_lithology_group = self.get_main_lithology_group_for_lithology_group(lithology_group)
 
         main_lithology_group.lithology_groups.remove(lithology_group)
+        self.index.remove_lithology_group(lithology_group)
+
+    def delete_curve(self, curve: Curve | str) -> None:
+        """Delete curve"""
+        if isinstance(curve, str):
+            curve, curve_group = self.get_curve(curve)
+        elif isinstance(curve, Curve):
+            curve_group = self.get_curve_group_for_curve(curve)
+
+        curve_group.curves.remove(curve)
+        self.index.remove_curve(curve)
 
     def delete_lithology(self, lithology: Lithology | str) -> None:
         """Delete lithology"""
         if isinstance(lithology, str):
             lithology, lithology_group, _main_lithology_group = self.get_lithology(lithology)
         elif isinstance(lithology, Lithology):
-            lithology_group = self.get_lithology_group_for_lithology(lithology)
+            lithology_group, _main_lithology_group = self.get_lithology_group_for_lithology(lithology)
 
         lithology_group.lithologies.remove(lithology)
+        self.index.remove_lithology(lithology)
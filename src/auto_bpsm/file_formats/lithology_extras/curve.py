@@ -1,5 +1,6 @@
 from typing import Optional
 from pydantic_xml import BaseXmlModel, element
+import numpy as np
 import pandas as pd
 
 from auto_bpsm.utilities import decode_id_and_name, items_lookup_return
@@ -29,28 +30,55 @@ class Curve(BaseXmlModel):
     petromod_id: str = element(tag="PetroModId")
     curve_points: list[CurvePoint] = element(tag="CurvePoint")
 
+    def get_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the x and y values of the curve points as arrays"""
+        n_points = len(self.curve_points)
+        x = np.fromiter([curve_point.x for curve_point in self.curve_points], dtype=float, count=n_points)
+        y = np.fromiter([curve_point.y for curve_point in self.curve_points], dtype=float, count=n_points)
+        return x, y
+
+    @property
+    def x(self) -> np.ndarray:
+        """Returns the x values"""
+        return self.get_arrays()[0]
+
+    @property
+    def y(self) -> np.ndarray:
+        """Returns the y values"""
+        return self.get_arrays()[1]
+
+    def set_points(self, x, y) -> None:
+        """Sets the curve points from x and y values"""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.ndim != 1 or x.shape != y.shape:
+            raise ValueError("x and y should be one dimensional with the same length")
+
+        # The values are already floats, so the points are not validated one by one
+        self.curve_points = [
+            CurvePoint.construct(x=x_value, y=y_value) for x_value, y_value in zip(x.tolist(), y.tolist())
+        ]
+
+    def scale(self, x_factor: float = 1.0, y_factor: float = 1.0) -> None:
+        """Multiplies the x and y values"""
+        x, y = self.get_arrays()
+        self.set_points(x * x_factor, y * y_factor)
+
+    def shift(self, x_offset: float = 0.0, y_offset: float = 0.0) -> None:
+        """Adds to the x and y values"""
+        x, y = self.get_arrays()
+        self.set_points(x + x_offset, y + y_offset)
+
     @property
     def curve_table(self) -> pd.DataFrame:
         """Get teh curve table"""
-        x_values = []
-        y_values = []
-        for curve_point in self.curve_points:
-            x_values.append(curve_point.x)
-            y_values.append(curve_point.y)
-
-        table = pd.DataFrame.from_dict({"x": x_values, "y": y_values})
+        x, y = self.get_arrays()
+        table = pd.DataFrame({"x": x, "y": y})
         return table
 
     def set_curve_table(self, table: pd.DataFrame) -> None:
         """Sets the curves points from table"""
-        curve_points = []
-        for row in table.iterrows():
-            x = row[1].x
-            y = row[1].y
-            curve_point = CurvePoint(x=x, y=y)
-            curve_points.append(curve_point)
-
-        self.curve_points = curve_points
+        self.set_points(table["x"].to_numpy(dtype=float), table["y"].to_numpy(dtype=float))
 
 
 class CurveGroup(BaseXmlModel):
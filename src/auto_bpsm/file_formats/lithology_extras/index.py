@@ -0,0 +1,149 @@
+from auto_bpsm.file_formats.lithology_extras.meta import MetaParameter, MetaParameterGroup
+from auto_bpsm.file_formats.lithology_extras.curve import CurveGroup, Curve
+from auto_bpsm.file_formats.lithology_extras.litho import LithologyGroup, Lithology, MainLithologyGroup
+
+
+class CatalogueIndex:
+    """Id, name and parent lookups for the objects of a lithology catalogue"""
+
+    def __init__(self):
+        """Initializes empty indexes"""
+        self.main_lithology_groups_by_id: dict[str, MainLithologyGroup] = {}
+        self.main_lithology_groups_by_name: dict[str, list[MainLithologyGroup]] = {}
+        self.lithology_groups_by_id: dict[str, tuple[LithologyGroup, MainLithologyGroup]] = {}
+        self.lithology_groups_by_name: dict[str, list[tuple[LithologyGroup, MainLithologyGroup]]] = {}
+        self.lithologies_by_id: dict[str, tuple[Lithology, LithologyGroup, MainLithologyGroup]] = {}
+        self.lithologies_by_name: dict[str, list[tuple[Lithology, LithologyGroup, MainLithologyGroup]]] = {}
+        self.curves_by_id: dict[str, tuple[Curve, CurveGroup]] = {}
+        self.curves_by_name: dict[str, list[tuple[Curve, CurveGroup]]] = {}
+        self.meta_parameters_by_id: dict[str, tuple[MetaParameter, MetaParameterGroup]] = {}
+        self.meta_parameters_by_name: dict[str, list[tuple[MetaParameter, MetaParameterGroup]]] = {}
+        self.meta_parameter_groups_by_id: dict[str, MetaParameterGroup] = {}
+        self.meta_parameter_groups_by_name: dict[str, list[MetaParameterGroup]] = {}
+
+    @staticmethod
+    def build(catalogue) -> "CatalogueIndex":
+        """Builds the indexes by walking the catalogue once"""
+        index = CatalogueIndex()
+        for main_lithology_group in catalogue.main_lithology_groups:
+            index.add_main_lithology_group(main_lithology_group)
+        for curve_group in catalogue.curve_groups:
+            for curve in curve_group.curves or []:
+                index.add_curve(curve, curve_group)
+
+        to_search = catalogue.meta.meta_parameter_groups.copy()
+        while len(to_search) > 0:
+            meta_parameter_group = to_search.pop()
+            index.add_meta_parameter_group(meta_parameter_group)
+            if meta_parameter_group.meta_parameter_groups is not None:
+                to_search.extend(meta_parameter_group.meta_parameter_groups)
+        return index
+
+    @staticmethod
+    def add_entry(by_id: dict, by_name: dict, id: str, name: str, entry) -> None:
+        """Adds an entry to an id and a name index"""
+        by_id[id] = entry
+        by_name.setdefault(name, []).append(entry)
+
+    @staticmethod
+    def remove_entry(by_id: dict, by_name: dict, id: str, name: str) -> None:
+        """Removes an entry from an id and a name index"""
+        entry = by_id.pop(id, None)
+        if entry is None:
+            return
+        entries = [other_entry for other_entry in by_name.get(name, []) if other_entry is not entry]
+        if entries:
+            by_name[name] = entries
+        else:
+            by_name.pop(name, None)
+
+    def add_main_lithology_group(self, main_lithology_group: MainLithologyGroup) -> None:
+        """Adds a main lithology group with its lithology groups"""
+        self.add_entry(
+            self.main_lithology_groups_by_id,
+            self.main_lithology_groups_by_name,
+            main_lithology_group.id,
+            main_lithology_group.name,
+            main_lithology_group,
+        )
+        for lithology_group in main_lithology_group.lithology_groups or []:
+            self.add_lithology_group(lithology_group, main_lithology_group)
+
+    def remove_main_lithology_group(self, main_lithology_group: MainLithologyGroup) -> None:
+        """Removes a main lithology group with its lithology groups"""
+        for lithology_group in main_lithology_group.lithology_groups or []:
+            self.remove_lithology_group(lithology_group)
+        self.remove_entry(
+            self.main_lithology_groups_by_id,
+            self.main_lithology_groups_by_name,
+            main_lithology_group.id,
+            main_lithology_group.name,
+        )
+
+    def add_lithology_group(self, lithology_group: LithologyGroup, main_lithology_group: MainLithologyGroup) -> None:
+        """Adds a lithology group with its lithologies"""
+        self.add_entry(
+            self.lithology_groups_by_id,
+            self.lithology_groups_by_name,
+            lithology_group.id,
+            lithology_group.name,
+            (lithology_group, main_lithology_group),
+        )
+        for lithology in lithology_group.lithologies or []:
+            self.add_lithology(lithology, lithology_group, main_lithology_group)
+
+    def remove_lithology_group(self, lithology_group: LithologyGroup) -> None:
+        """Removes a lithology group with its lithologies"""
+        for lithology in lithology_group.lithologies or []:
+            self.remove_lithology(lithology)
+        self.remove_entry(
+            self.lithology_groups_by_id,
+            self.lithology_groups_by_name,
+            lithology_group.id,
+            lithology_group.name,
+        )
+
+    def add_lithology(
+        self,
+        lithology: Lithology,
+        lithology_group: LithologyGroup,
+        main_lithology_group: MainLithologyGroup,
+    ) -> None:
+        """Adds a lithology"""
+        self.add_entry(
+            self.lithologies_by_id,
+            self.lithologies_by_name,
+            lithology.id,
+            lithology.name,
+            (lithology, lithology_group, main_lithology_group),
+        )
+
+    def remove_lithology(self, lithology: Lithology) -> None:
+        """Removes a lithology"""
+        self.remove_entry(self.lithologies_by_id, self.lithologies_by_name, lithology.id, lithology.name)
+
+    def add_curve(self, curve: Curve, curve_group: CurveGroup) -> None:
+        """Adds a curve"""
+        self.add_entry(self.curves_by_id, self.curves_by_name, curve.id, curve.name, (curve, curve_group))
+
+    def remove_curve(self, curve: Curve) -> None:
+        """Removes a curve"""
+        self.remove_entry(self.curves_by_id, self.curves_by_name, curve.id, curve.name)
+
+    def add_meta_parameter_group(self, meta_parameter_group: MetaParameterGroup) -> None:
+        """Adds a meta parameter group and its own meta parameters"""
+        self.add_entry(
+            self.meta_parameter_groups_by_id,
+            self.meta_parameter_groups_by_name,
+            meta_parameter_group.id,
+            meta_parameter_group.name,
+            meta_parameter_group,
+        )
+        for meta_parameter in meta_parameter_group.meta_parameters or []:
+            self.add_entry(
+                self.meta_parameters_by_id,
+                self.meta_parameters_by_name,
+                meta_parameter.id,
+                meta_parameter.name,
+                (meta_parameter, meta_parameter_group),
+            )
@@ -10,7 +10,7 @@ class Parameter(BaseXmlModel, search_mode="unordered"):
     @property
     def is_curve(self) -> bool:
         """Quickly check if it is curve"""
-        is_curve_value = is_md5(self.value)
+        is_curve_value = self.value is not None and is_md5(self.value)
         return is_curve_value
 
 
@@ -0,0 +1,412 @@
+from collections.abc import Collection
+from pathlib import Path
+import hashlib
+import os
+import pickle
+from lxml import etree
+from pydantic_xml import BaseXmlModel
+from auto_bpsm.utilities import decode_id_and_name, is_md5
+
+INDEXED_TAGS = ("MetaParameterGroup", "MetaParameter", "CurveGroup", "Curve", "LithologyGroup", "Lithology")
+SELECTABLE_TAGS = ("Lithology", "Curve")
+ROOT_KEY = "Catalogue"
+META_KEY = "Meta"
+
+# Fields of the catalogue nodes that hold other nodes, by class name, with the tag of their elements
+CHILD_FIELDS = {
+    "LithologyCatalogue": (
+        ("meta", "Meta"),
+        ("curve_groups", "CurveGroup"),
+        ("main_lithology_groups", "LithologyGroup"),
+    ),
+    "Meta": (("meta_parameter_groups", "MetaParameterGroup"),),
+    "MetaParameterGroup": (("meta_parameters", "MetaParameter"), ("meta_parameter_groups", "MetaParameterGroup")),
+    "CurveGroup": (("curves", "Curve"),),
+    "MainLithologyGroup": (("lithology_groups", "LithologyGroup"),),
+    "LithologyGroup": (("lithologies", "Lithology"),),
+}
+
+
+class CatalogueTree:
+    """XML of a lithology catalogue file and the state of the nodes handed out for editing"""
+
+    filename: Path
+    signature: tuple[int, int] | None
+    is_partial: bool
+    has_declaration: bool
+    trailing_text: str
+    saved_keys: set[str]
+    tracked_nodes: dict[str, BaseXmlModel]
+    fingerprints: dict[str, tuple[bytes, tuple[str, ...]]]
+
+    def __init__(self, filename: Path):
+        """Initializes the tree of a file, nothing is read yet"""
+        self.filename = Path(filename)
+        self.signature = None
+        self.is_partial = False
+        self.has_declaration = False
+        self.trailing_text = ""
+        self.saved_keys = set()
+        self.tracked_nodes = {}
+        self.fingerprints = {}
+        self.raw_xml: bytes = None
+        self.element_map: dict[str, etree._Element] = None
+        self._root: etree._Element = None
+
+    @staticmethod
+    def get_signature(filename: Path) -> tuple[int, int]:
+        """Modification time and size of a file"""
+        file_stat = os.stat(filename)
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+    def read(self) -> etree._Element:
+        """Parses the whole file, which should not have changed since it was read or written"""
+        signature = CatalogueTree.get_signature(self.filename)
+        if self.signature is not None and signature != self.signature:
+            raise RuntimeError(f"{self.filename} changed since it was read")
+        with open(self.filename, "rb") as f:
+            raw_xml = f.read()
+        self.signature = signature
+        self.has_declaration = raw_xml.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<?xml")
+        self.trailing_text = raw_xml[len(raw_xml.rstrip()) :].decode(encoding="utf-8").replace("\r\n", "\n")
+        self._root = etree.fromstring(raw_xml, parser=etree.XMLParser(huge_tree=True))
+        self.element_map = None
+        return self._root
+
+    @property
+    def root(self) -> etree._Element:
+        """Returns the root element, a partial tree reads the whole file when it is written"""
+        if self._root is None:
+            if self.raw_xml is None:
+                return self.read()
+            self._root = etree.fromstring(self.raw_xml, parser=etree.XMLParser(huge_tree=True))
+            self.raw_xml = None
+        return self._root
+
+    def set_root(self, catalogue: BaseXmlModel) -> None:
+        """Replaces the tree with the serialized catalogue, indented like a pretty printed file"""
+        root = catalogue.to_xml_tree(skip_empty=True)
+        etree.indent(root)
+        self._root = root
+        self.raw_xml = None
+        self.element_map = None
+        self.is_partial = False
+        self.has_declaration = False
+        self.trailing_text = "\n"
+
+        # The tree now holds the current state of the tracked nodes
+        self.saved_keys = CatalogueTree.get_keys(catalogue)
+        self.fingerprints = {key: CatalogueTree.get_fingerprint(node) for key, node in self.tracked_nodes.items()}
+
+    def __getstate__(self) -> dict:
+        """Pickles the tree as xml"""
+        state = self.__dict__.copy()
+        if self._root is not None:
+            state["raw_xml"] = etree.tostring(self._root, encoding="utf-8")
+        state["_root"] = None
+        state["element_map"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Restores the pickled xml, parsed on first use"""
+        self.__dict__.update(state)
+
+    def select_lithologies(self, lithologies: Collection[str]) -> etree._Element:
+        """Parses only the given lithologies, their mixing components and their curves, with the groups and meta"""
+        self.signature = CatalogueTree.get_signature(self.filename)
+        self.is_partial = True
+
+        # A first pass keeps only what the lithologies reference, the elements are dropped once read
+        lithology_ids_by_name = {}
+        references_by_id = {}
+        curve_ids = set()
+        for _event, element in etree.iterparse(str(self.filename), tag=SELECTABLE_TAGS, huge_tree=True):
+            id = element.findtext("Id")
+            if id is not None and element.tag == "Curve":
+                curve_ids.add(id)
+            elif id is not None:
+                lithology_ids_by_name.setdefault(element.findtext("Name"), []).append(id)
+                component_elements = element.iterfind("Mixing/LithologyComponent/LithologyId")
+                component_ids = [component_element.text for component_element in component_elements]
+                values = [value.text for value in element.iterfind("ParameterGroup/Parameter/Value")]
+                references_by_id[id] = (component_ids, [value for value in values if value and is_md5(value)])
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+        to_search = []
+        for identifier in lithologies:
+            id, name = decode_id_and_name(identifier)
+            if id is not None:
+                found_ids = [id] if id in references_by_id else []
+            else:
+                found_ids = lithology_ids_by_name.get(name, [])
+            if len(found_ids) == 0:
+                raise LookupError(f"Lithology {identifier} was not found")
+            to_search.extend(found_ids)
+
+        selected_ids = set()
+        while len(to_search) > 0:
+            id = to_search.pop()
+            if id in selected_ids:
+                continue
+            selected_ids.add(id)
+            component_ids, values = references_by_id[id]
+            to_search.extend([component_id for component_id in component_ids if component_id in references_by_id])
+            selected_ids.update([value for value in values if value in curve_ids])
+
+        # The second pass builds the tree without the content of the other lithologies and curves
+        dropped_elements = []
+        context = etree.iterparse(str(self.filename), tag=SELECTABLE_TAGS, huge_tree=True)
+        for _event, element in context:
+            if element.findtext("Id") not in selected_ids:
+                element.clear(keep_tail=True)
+                dropped_elements.append(element)
+        for element in dropped_elements:
+            CatalogueTree.remove_element(element)
+        return context.root
+
+    @staticmethod
+    def get_key(node: BaseXmlModel) -> str:
+        """Id of a node, the catalogue and its meta node have fixed keys"""
+        class_name = type(node).__name__
+        if class_name == "LithologyCatalogue":
+            return ROOT_KEY
+        if class_name == "Meta":
+            return META_KEY
+        return node.id
+
+    @staticmethod
+    def get_children(node: BaseXmlModel) -> list[tuple[str, BaseXmlModel]]:
+        """Child nodes of a node with the tag of their elements"""
+        children = []
+        for field_name, tag in CHILD_FIELDS.get(type(node).__name__, ()):
+            value = getattr(node, field_name)
+            if isinstance(value, BaseXmlModel):
+                children.append((tag, value))
+            elif value is not None:
+                children.extend([(tag, child) for child in value])
+        return children
+
+    @staticmethod
+    def get_fingerprint(node: BaseXmlModel) -> tuple[bytes, tuple[str, ...]]:
+        """Digest of the fields of a node, without its child nodes, and the keys of its child nodes"""
+        child_field_names = {field_name for field_name, _tag in CHILD_FIELDS.get(type(node).__name__, ())}
+        content = pickle.dumps(node.dict(exclude=child_field_names), protocol=4)
+        child_keys = tuple([CatalogueTree.get_key(child) for _tag, child in CatalogueTree.get_children(node)])
+        return hashlib.sha1(content).digest(), child_keys
+
+    @staticmethod
+    def get_keys(node: BaseXmlModel) -> set[str]:
+        """Keys of a node and its descendants"""
+        keys = {CatalogueTree.get_key(node)}
+        for _tag, child in CatalogueTree.get_children(node):
+            keys.update(CatalogueTree.get_keys(child))
+        return keys
+
+    def track(self, node: BaseXmlModel) -> None:
+        """Records the state of a node handed out for editing, so its changes are written"""
+        key = CatalogueTree.get_key(node)
+        if key not in self.tracked_nodes:
+            self.fingerprints[key] = CatalogueTree.get_fingerprint(node)
+
+        # Copies of the catalogue hand out their own nodes, which start from the same state
+        self.tracked_nodes[key] = node
+
+    def track_descendants(self, node: BaseXmlModel) -> None:
+        """Tracks a node written whole and its descendants"""
+        key = CatalogueTree.get_key(node)
+        self.saved_keys.add(key)
+        self.tracked_nodes[key] = node
+        self.fingerprints[key] = CatalogueTree.get_fingerprint(node)
+        for _tag, child in CatalogueTree.get_children(node):
+            self.track_descendants(child)
+
+    def forget(self, key: str) -> None:
+        """Stops tracking a node that is no longer in the tree"""
+        self.saved_keys.discard(key)
+        self.tracked_nodes.pop(key, None)
+        self.fingerprints.pop(key, None)
+
+    def is_changed(self, node: BaseXmlModel) -> bool:
+        """Checks if a node changed since it was read or written, untracked nodes only if they were never written"""
+        key = CatalogueTree.get_key(node)
+        if key not in self.fingerprints:
+            return key not in self.saved_keys
+        return self.fingerprints[key] != CatalogueTree.get_fingerprint(node)
+
+    def get_element_map(self) -> dict[str, etree._Element]:
+        """Returns the elements by id, built on first use"""
+        if self.element_map is None:
+            root = self.root
+            self.element_map = {}
+            self.map_elements(root)
+        return self.element_map
+
+    def map_elements(self, element: etree._Element) -> None:
+        """Adds an element and its indexed descendants to the element map"""
+        for child in element.iter(*INDEXED_TAGS):
+            id = child.findtext("Id")
+            if id is not None:
+                self.element_map[id] = child
+
+    def unmap_elements(self, element: etree._Element, forget: bool = False) -> None:
+        """Removes an element and its indexed descendants from the element map, and their tracking if forget"""
+        for child in element.iter(*INDEXED_TAGS):
+            id = child.findtext("Id")
+            if id is not None and self.element_map.get(id) is child:
+                del self.element_map[id]
+                if forget:
+                    self.forget(id)
+
+    def find_element(self, key: str) -> etree._Element | None:
+        """Returns the element of a node"""
+        if key == ROOT_KEY:
+            return self.root
+        if key == META_KEY:
+            return self.root.find("Meta")
+        return self.get_element_map().get(key)
+
+    def find_child_element(self, element: etree._Element, tag: str, key: str) -> etree._Element | None:
+        """Returns the child element of a node"""
+        if key == META_KEY:
+            return element.find(tag)
+        child_element = self.get_element_map().get(key)
+        if child_element is not None and child_element.getparent() is element:
+            return child_element
+
+        # Nodes moved between groups are mapped to their new element
+        for child_element in element.iterchildren(tag):
+            if child_element.findtext("Id") == key:
+                return child_element
+        return None
+
+    def get_indentation(self, level: int) -> str | None:
+        """Whitespace before an element at the level, None if the file is not indented"""
+        if not self.root.text or "\n" not in self.root.text:
+            return None
+        space = self.root.text.rsplit("\n", 1)[1]
+        return "\n" + space * level
+
+    def append_element(self, parent: etree._Element, element: etree._Element) -> None:
+        """Appends an element and indents it like its siblings"""
+        level = sum([1 for _ in parent.iterancestors()]) + 1
+        indentation = self.get_indentation(level)
+        if indentation is not None:
+            space = self.get_indentation(1)[1:]
+            etree.indent(element, space=space, level=level)
+            children = list(parent)
+            if children:
+                children[-1].tail = indentation
+            else:
+                parent.text = indentation
+            element.tail = self.get_indentation(level - 1)
+        parent.append(element)
+
+    def replace_element(self, element: etree._Element, new_element: etree._Element) -> None:
+        """Replaces an element in place keeping the layout"""
+        level = sum([1 for _ in element.iterancestors()])
+        if self.get_indentation(level) is not None:
+            etree.indent(new_element, space=self.get_indentation(1)[1:], level=level)
+        new_element.tail = element.tail
+        element.getparent().replace(element, new_element)
+
+    @staticmethod
+    def remove_element(element: etree._Element) -> None:
+        """Removes an element keeping the layout"""
+        parent = element.getparent()
+        previous = element.getprevious()
+        if element.getnext() is None:
+            if previous is not None:
+                previous.tail = element.tail
+            else:
+                parent.text = None
+        parent.remove(element)
+
+    @staticmethod
+    def update_fields(node: BaseXmlModel, element: etree._Element) -> None:
+        """Writes the fields of a node that are not child nodes into its element"""
+        child_fields = CHILD_FIELDS.get(type(node).__name__, ())
+        child_tags = {tag for _field_name, tag in child_fields}
+        empty_node = node.copy(update={field_name: None for field_name, _tag in child_fields})
+        new_element = empty_node.to_xml_tree(skip_empty=True)
+
+        field_elements = [child for child in element if child.tag not in child_tags]
+        new_tags = {new_field_element.tag for new_field_element in new_element}
+        for field_element in field_elements:
+            if field_element.tag not in new_tags:
+                CatalogueTree.remove_element(field_element)
+        for i, new_field_element in enumerate(new_element):
+            field_element = element.find(new_field_element.tag)
+            if field_element is not None:
+                field_element.text = new_field_element.text
+            else:
+                new_field_element.tail = element[i - 1].tail if i > 0 else element.text
+                element.insert(i, new_field_element)
+
+    def apply_node_changes(self, node: BaseXmlModel, element: etree._Element) -> None:
+        """Writes the changes of a tracked node into its element"""
+        key = CatalogueTree.get_key(node)
+        fingerprint = CatalogueTree.get_fingerprint(node)
+        previous_digest, previous_child_keys = self.fingerprints[key]
+
+        # Nodes without child nodes are written whole
+        if type(node).__name__ not in CHILD_FIELDS:
+            new_element = node.to_xml_tree(skip_empty=True)
+            new_element.tag = element.tag
+            self.unmap_elements(element)
+            self.replace_element(element, new_element)
+            self.map_elements(new_element)
+            self.fingerprints[key] = fingerprint
+            return
+
+        if fingerprint[0] != previous_digest:
+            CatalogueTree.update_fields(node, element)
+
+        # Only the children that were read are compared, the others are kept
+        children = CatalogueTree.get_children(node)
+        child_keys = {CatalogueTree.get_key(child) for _child_tag, child in children}
+        child_tags = {child_tag for _field_name, child_tag in CHILD_FIELDS[type(node).__name__]}
+        for child_key in previous_child_keys:
+            if child_key in child_keys:
+                continue
+            for child_tag in child_tags:
+                child_element = self.find_child_element(element, child_tag, child_key)
+                if child_element is not None:
+                    self.unmap_elements(child_element, forget=True)
+                    CatalogueTree.remove_element(child_element)
+                    break
+
+        for child_tag, child in children:
+            child_key = CatalogueTree.get_key(child)
+            if child_key in previous_child_keys:
+                continue
+            new_element = child.to_xml_tree(skip_empty=True)
+            new_element.tag = child_tag
+            self.append_element(element, new_element)
+            self.map_elements(new_element)
+            self.track_descendants(child)
+        self.fingerprints[key] = fingerprint
+
+    def apply_changes(self) -> None:
+        """Writes the tracked nodes that changed since they were read or written into the tree"""
+        for key, node in list(self.tracked_nodes.items()):
+            # Nodes removed with a group earlier in the pass are no longer tracked
+            if self.tracked_nodes.get(key) is not node or not self.is_changed(node):
+                continue
+            element = self.find_element(key)
+            if element is not None:
+                self.apply_node_changes(node, element)
+
+    def to_string(self) -> str:
+        """Serializes the tree"""
+        xml_byte = etree.tostring(self.root, encoding="utf-8", xml_declaration=self.has_declaration)
+        return xml_byte.decode(encoding="utf-8") + self.trailing_text
+
+    def finish_write(self, filename: Path) -> None:
+        """Points the tree to the written file, a partial tree drops the whole file it read"""
+        self.filename = Path(filename)
+        self.signature = CatalogueTree.get_signature(self.filename)
+        if self.is_partial:
+            self._root = None
+            self.element_map = None
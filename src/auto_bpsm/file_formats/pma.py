@@ -1,10 +1,12 @@
 from pathlib import Path
+from auto_bpsm.utilities import md5, write_atomic
 
 
 class PetroModASCII(dict):
     """A PMA file"""
 
     filename: Path
+    content_hash: str = None
 
     @staticmethod
     def read_file(filename: Path):
@@ -21,6 +23,7 @@ class PetroModASCII(dict):
             pma[key] = value
 
         pma.filename = filename
+        pma.content_hash = md5(pma.to_string())
 
         return pma
 
@@ -30,10 +33,20 @@ class PetroModASCII(dict):
             raise FileExistsError
         self.write_file(self.filename)
 
-    def write_file(self, filname: Path) -> None:
-        """Writes the pma file"""
+    def to_string(self) -> str:
+        """Returns the file content"""
         lines = []
         for key, value in self.items():
             lines.append(f"{str(key)} {str(value)}\n")
-        with open(filname, "w", encoding="utf-8") as f:
-            f.writelines(lines)
+        return "".join(lines)
+
+    @property
+    def is_modified(self) -> bool:
+        """Checks if the entries changed since they were read or written"""
+        return self.content_hash is None or md5(self.to_string()) != self.content_hash
+
+    def write_file(self, filname: Path) -> None:
+        """Writes the pma file"""
+        content = self.to_string()
+        write_atomic(filname, content)
+        self.content_hash = md5(content)
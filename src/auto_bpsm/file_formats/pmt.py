@@ -1,5 +1,12 @@
+from numbers import Number
 from pathlib import Path
+import csv
+import io
+import re
 import pandas as pd
+from auto_bpsm.utilities import md5, write_atomic
+
+FORMAT_PATTERN = re.compile(r"%[-+ #0]*\d*(?:\.\d+)?[hlL]*([diouxXeEfFgGs])")
 
 
 class PetroModTable:
@@ -11,6 +18,11 @@ class PetroModTable:
     table: pd.DataFrame
 
     filename: Path
+    content_hash: str = None
+
+    # Text of the data block and the typed table it was read as
+    raw_table: pd.DataFrame = None
+    original_table: pd.DataFrame = None
 
     @staticmethod
     def line_to_data(line: str, prefix: str = None):
@@ -32,6 +44,82 @@ class PetroModTable:
         line = line + " |\n"
         return line
 
+    @staticmethod
+    def get_format_type(format_item: str) -> str:
+        """Returns the column type (int, float or str) of a Format entry"""
+        format_item = format_item.strip()
+        match = FORMAT_PATTERN.fullmatch(format_item)
+        if match:
+            conversion = match.group(1)
+            if conversion in "diouxX":
+                return "int"
+            if conversion in "eEfFgG":
+                return "float"
+            return "str"
+
+        format_item = format_item.lower()
+        if format_item.startswith("int"):
+            return "int"
+        if format_item.startswith(("float", "double", "real")):
+            return "float"
+        return "str"
+
+    @staticmethod
+    def convert_column(column: pd.Series, format_type: str) -> pd.Series:
+        """Converts a text column to the Format type, text that is not numeric is kept as is"""
+        if format_type == "str":
+            return column
+
+        is_empty = column == ""
+        values = pd.to_numeric(column.where(~is_empty), errors="coerce")
+        if values[~is_empty].isna().any():
+            return column
+
+        is_integer = (values.dropna() % 1 == 0).all()
+        if format_type == "int" and is_integer:
+            return values.astype("Int64") if is_empty.any() else values.astype("int64")
+        return values.astype(float)
+
+    @staticmethod
+    def read_data_block(data_lines: list[str], columns: list[str]) -> pd.DataFrame:
+        """Reads the data lines in bulk into a text table"""
+        data_block = "".join(data_lines)
+        try:
+            raw_table = pd.read_csv(
+                io.StringIO(data_block),
+                sep="|",
+                header=None,
+                dtype=object,
+                keep_default_na=False,
+                quoting=csv.QUOTE_NONE,
+                skipinitialspace=True,
+                engine="c",
+            )
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=columns, dtype=object)
+        except pd.errors.ParserError:
+            raw_table = None
+
+        # Expected layout: Data | value | ... | value |
+        n_columns = len(columns)
+        is_regular = (
+            raw_table is not None
+            and raw_table.shape[1] == n_columns + 2
+            and {value.strip() for value in raw_table.iloc[:, 0].unique()} == {"Data"}
+            and {value.strip() for value in raw_table.iloc[:, -1].unique()} == {""}
+        )
+        if not is_regular:
+            data = [line.replace("Data", "") for line in data_lines]
+            data_list = []
+            for line in data:
+                data_list.append(PetroModTable.line_to_data(line, "Data"))
+            return pd.DataFrame(data=data_list, columns=columns)
+
+        data = {i: [value.rstrip() for value in raw_table.iloc[:, i + 1]] for i in range(n_columns)}
+        raw_table = pd.DataFrame(data=data, index=raw_table.index, dtype=object)
+        raw_table.columns = columns
+        return raw_table
+
     @staticmethod
     def read_file(filename: Path):
         """Read a pma file"""
@@ -81,13 +169,12 @@ class PetroModTable:
         i = i + 1
 
         # Data
-        data = raw_pmt[i:]
-        data = [line.replace("Data", "") for line in data]
-        data_list = []
-        for line in data:
-            data_list.append(PetroModTable.line_to_data(line, "Data"))
+        raw_table = PetroModTable.read_data_block(raw_pmt[i:], key)
+        pmt_table = raw_table.copy()
+        for column_index, format_item in enumerate(format[: len(key)]):
+            format_type = PetroModTable.get_format_type(format_item)
+            pmt_table.isetitem(column_index, PetroModTable.convert_column(raw_table.iloc[:, column_index], format_type))
 
-        pmt_table = pd.DataFrame(data=data_list, columns=key)
         pmt = PetroModTable()
         pmt.start_comments = start_comments
         pmt.headers = headers
@@ -95,7 +182,10 @@ class PetroModTable:
         pmt.stop = stop
         pmt.split_line = split_line
         pmt.table = pmt_table
+        pmt.raw_table = raw_table
+        pmt.original_table = pmt_table.copy()
         pmt.filename = filename
+        pmt.content_hash = md5(pmt.to_string())
 
         return pmt
 
@@ -105,17 +195,81 @@ class PetroModTable:
             raise FileExistsError
         self.write_file(self.filename)
 
+    def to_string(self) -> str:
+        """Returns the file content"""
+        lines = []
+        lines.extend(self.start_comments)
+        for header in self.headers:
+            lines.append(PetroModTable.data_to_line(header, "Head"))
+        columns = self.table.columns
+        lines.append(PetroModTable.data_to_line(columns, "Key"))
+        lines.append(self.stop)
+        lines.append(PetroModTable.data_to_line(self.format, "Format"))
+        lines.append(self.split_line)
+        lines.append(self.get_data_block())
+        return "".join(lines)
+
+    @staticmethod
+    def format_column(values: pd.Series, format_item: str = None) -> pd.Series:
+        """Renders a column as text following its Format entry"""
+        strings = pd.Series("", index=values.index, dtype=object)
+        is_present = values.notna()
+        present_values = values[is_present].tolist()
+
+        is_printf = format_item is not None and FORMAT_PATTERN.fullmatch(format_item.strip()) is not None
+        if is_printf and PetroModTable.get_format_type(format_item) != "str":
+            format_item = format_item.strip()
+            strings[is_present] = [
+                format_item % value if isinstance(value, Number) and not isinstance(value, bool) else str(value)
+                for value in present_values
+            ]
+        else:
+            strings[is_present] = [str(value) for value in present_values]
+        return strings
+
+    def get_data_strings(self) -> pd.DataFrame:
+        """Returns the table as text, values that did not change keep the text they were read with"""
+        data_strings = pd.DataFrame(index=self.table.index)
+        for column_index, column in enumerate(self.table.columns):
+            values = self.table.iloc[:, column_index]
+            format_item = self.format[column_index] if column_index < len(self.format) else None
+            if self.raw_table is None or column not in self.raw_table.columns:
+                data_strings[column_index] = PetroModTable.format_column(values, format_item)
+                continue
+
+            # Only changed values are rendered
+            original_values = self.original_table[column].reindex(values.index)
+            raw_strings = self.raw_table[column].reindex(values.index)
+            is_same = values.eq(original_values).fillna(False).astype(bool)
+            is_same = (is_same | (values.isna() & original_values.isna())) & raw_strings.notna()
+            strings = raw_strings.astype(object)
+            if not is_same.all():
+                strings[~is_same] = PetroModTable.format_column(values[~is_same], format_item)
+            data_strings[column_index] = strings
+        data_strings.columns = self.table.columns
+        return data_strings
+
+    def get_data_block(self) -> str:
+        """Renders all the data lines at once"""
+        data_strings = self.get_data_strings()
+        if len(data_strings) == 0:
+            return ""
+
+        joined = pd.Series("", index=data_strings.index, dtype=object)
+        for column_index in range(data_strings.shape[1]):
+            separator = " | " if column_index > 0 else ""
+            joined = joined + separator + data_strings.iloc[:, column_index]
+        return "".join(("Data | " + joined + " |\n").tolist())
+
+    @property
+    def is_modified(self) -> bool:
+        """Checks if the table changed since it was read or written"""
+        return self.content_hash is None or md5(self.to_string()) != self.content_hash
+
     def write_file(self, filename: Path):
         """Write the files"""
-        with open(filename, "w", encoding="utf-8") as f:
-            f.writelines(self.start_comments)
-            for header in self.headers:
-                f.write(PetroModTable.data_to_line(header, "Head"))
-            columns = self.table.columns
-            f.write(PetroModTable.data_to_line(columns, "Key"))
-            f.write(self.stop)
-            f.write(PetroModTable.data_to_line(self.format, "Format"))
-            f.write(self.split_line)
-            data_list = self.table.values.tolist()
-            for row in data_list:
-                f.write(PetroModTable.data_to_line(row, "Data"))
+        content = self.to_string()
+        write_atomic(filename, content)
+        self.content_hash = md5(content)
+        self.raw_table = self.get_data_strings()
+        self.original_table = self.table.copy()
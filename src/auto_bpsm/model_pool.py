@@ -0,0 +1,125 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Annotated
+import os
+import queue
+import shutil
+from auto_bpsm.petromod_models import MODEL_INPUT_FOLDERS
+from auto_bpsm.petromod_project import PetroModProject, ValueRange
+
+POOL_MODEL_SEPARATOR = "_pool_"
+
+
+class ModelPool:
+    """Working copies of a template model, each lent to one trial at a time"""
+
+    project: PetroModProject
+    template_model_name: str
+    template_folder: Path
+    model_dimension: int
+    model_names: list[str]
+
+    def __init__(
+        self,
+        project: PetroModProject,
+        template_model_name: str,
+        pool_size: int,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ):
+        """Clones the template, copies left by an earlier pool are reset instead"""
+        template_folder = project.get_model_folder(template_model_name, model_dimension)
+        if template_folder is None:
+            raise FileNotFoundError(f"Model {template_model_name} was not found")
+        self.project = project
+        self.template_model_name = template_model_name
+        self.template_folder = template_folder
+        self.model_dimension = int(str(template_folder.parent.name)[2])
+        self.model_names = [f"{template_model_name}{POOL_MODEL_SEPARATOR}{i}" for i in range(pool_size)]
+
+        existing_model_names = [
+            model_name for model_name in self.model_names if Path(template_folder.parent, model_name).is_dir()
+        ]
+        new_model_names = [model_name for model_name in self.model_names if model_name not in existing_model_names]
+        project.duplicate_models(template_model_name, new_model_names, self.model_dimension, inputs_only=True)
+        for model_name in existing_model_names:
+            self.reset(model_name)
+
+        self._available = queue.Queue()
+        for model_name in self.model_names:
+            self._available.put(model_name)
+
+    def __enter__(self) -> "ModelPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.remove()
+
+    def get_model_folder(self, model_name: str) -> Path:
+        """Returns the folder of a working copy"""
+        return Path(self.template_folder.parent, model_name)
+
+    @staticmethod
+    def get_file_stats(model_folder: Path) -> dict[Path, os.stat_result]:
+        """Stats of the top level and input files of a model"""
+        file_stats = {}
+        for relative_filename in PetroModProject.list_model_inputs(model_folder):
+            file_stats[relative_filename] = os.stat(Path(model_folder, relative_filename))
+        return file_stats
+
+    @staticmethod
+    def is_same_copy(file_stat: os.stat_result, template_file_stat: os.stat_result) -> bool:
+        """Checks if a file is an unchanged copy of the template file"""
+        # A file sharing the template inode is a link, which a write in place would have changed with the template
+        if (file_stat.st_dev, file_stat.st_ino) == (template_file_stat.st_dev, template_file_stat.st_ino):
+            return False
+        return (file_stat.st_size, file_stat.st_mtime_ns) == (template_file_stat.st_size, template_file_stat.st_mtime_ns)
+
+    def reset(self, model_name: str) -> None:
+        """Restores the files of a working copy that differ from the template and removes the outputs"""
+        model_folder = self.get_model_folder(model_name)
+        template_file_stats = ModelPool.get_file_stats(self.template_folder)
+        model_file_stats = ModelPool.get_file_stats(model_folder)
+
+        for relative_filename in model_file_stats:
+            if relative_filename not in template_file_stats:
+                Path(model_folder, relative_filename).unlink()
+
+        # The pool holds copies, which keep the template modification time while they are unchanged
+        for relative_filename, template_file_stat in template_file_stats.items():
+            model_file_stat = model_file_stats.get(relative_filename)
+            if model_file_stat is not None and ModelPool.is_same_copy(model_file_stat, template_file_stat):
+                continue
+            Path(model_folder, relative_filename).unlink(missing_ok=True)
+            PetroModProject.copy_model_file(self.template_folder, model_folder, relative_filename)
+
+        for filename in model_folder.iterdir():
+            if filename.is_dir() and filename.name not in MODEL_INPUT_FOLDERS:
+                shutil.rmtree(filename)
+
+    def recreate(self, model_name: str) -> None:
+        """Clones the template again into a working copy"""
+        shutil.rmtree(self.get_model_folder(model_name), ignore_errors=True)
+        self.project.duplicate_models(self.template_model_name, [model_name], self.model_dimension, inputs_only=True)
+
+    @contextmanager
+    def checkout(self, timeout: float = None) -> Iterator[str]:
+        """Lends a working copy, waiting if all are in use, and resets it when it is returned"""
+        model_name = self._available.get(timeout=timeout)
+        try:
+            yield model_name
+        finally:
+            # A copy that could not be reset is cloned again, and returned in any case so the pool keeps its size
+            try:
+                self.reset(model_name)
+            except Exception:
+                self.recreate(model_name)
+            finally:
+                self._available.put(model_name)
+
+    def remove(self) -> None:
+        """Deletes the working copies"""
+        for model_name in self.model_names:
+            model_folder = self.get_model_folder(model_name)
+            if model_folder.is_dir():
+                shutil.rmtree(model_folder)
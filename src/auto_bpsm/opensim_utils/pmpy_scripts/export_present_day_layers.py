@@ -0,0 +1,83 @@
+"""Exports several present day layers in one runpmpy launch
+
+The script runs inside the PetroMod python interpreter. It takes the path of the PetroMod demo opensim
+script as its argument and reads the requested layer names from export_request.json in the working
+folder. It runs the demo script once per layer in the same interpreter and writes all the layers to
+export_layers.json in the working folder.
+"""
+import contextlib
+import io
+import json
+import re
+import runpy
+import sys
+from pathlib import Path
+
+DEMO_OUTPUT_FILENAME = "demo_1.txt"
+REQUEST_FILENAME = "export_request.json"
+OUTPUT_FILENAME = "export_layers.json"
+
+
+def run_demo_script(demo_script, layer_index):
+    """Runs the demo script and returns what it printed"""
+    argv = sys.argv
+    sys.argv = [str(demo_script), str(layer_index)]
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            runpy.run_path(str(demo_script), run_name="__main__")
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = argv
+    return log.getvalue()
+
+
+def parse_layers_indecies(log):
+    """Parses the layer table printed by the demo script"""
+    lines = [re.sub(" +", " ", line.strip()) for line in log.split("\n")]
+    layers = []
+    is_data = False
+    for line in lines:
+        if line == "Number Name":
+            is_data = True
+            continue
+        if not is_data or line == "":
+            continue
+        layers.append(line.split(maxsplit=1))
+    return layers
+
+
+def read_demo_output(filename):
+    """Reads the layer file written by the demo script"""
+    with open(filename, "r") as f:
+        lines = f.readlines()
+    layer_name = lines[4].split(":")[1].strip()
+    layer_unit = lines[5].split(":")[1].strip()
+    data = [line.strip().split() for line in lines[8:]]
+    return {"name": layer_name, "unit": layer_unit, "data": data}
+
+
+def main():
+    """Exports the requested layers"""
+    with open(REQUEST_FILENAME, "r") as f:
+        request = json.load(f)
+
+    # The demo script is found by the caller, once per petromod installation
+    demo_script = Path(sys.argv[1])
+    layers_indecies = parse_layers_indecies(run_demo_script(demo_script, -1))
+    layer_index_dict = {layer_name: layer_index for layer_index, layer_name in layers_indecies}
+
+    layers = {}
+    for layer_name in request["layers"]:
+        if layer_name not in layer_index_dict:
+            continue
+        run_demo_script(demo_script, layer_index_dict[layer_name])
+        layers[layer_name] = read_demo_output(DEMO_OUTPUT_FILENAME)
+
+    with open(OUTPUT_FILENAME, "w") as f:
+        json.dump({"layers_indecies": layers_indecies, "layers": layers}, f)
+
+
+if __name__ == "__main__":
+    main()
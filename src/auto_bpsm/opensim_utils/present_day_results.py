@@ -1,18 +1,88 @@
 from pathlib import Path
+import json
+import os
 import re
+import tempfile
+import threading
 import pandas as pd
 import numpy as np
+from auto_bpsm.petromod_models import MODEL_INPUT_FOLDERS
 from auto_bpsm.petromod_project import PetroModProject
 
+SCRATCH_FOLDER_PREFIX = "auto_bpsm_"
+EXPORT_LAYERS_SCRIPT = Path(Path(__file__).parent, "pmpy_scripts", "export_present_day_layers.py")
+DEMO_SCRIPT_NAME = "demo_opensim_output_3rd_party_format.py"
+EXPORT_REQUEST_FILENAME = "export_request.json"
+EXPORT_OUTPUT_FILENAME = "export_layers.json"
 
-def get_layers_indecies(project: PetroModProject, model_name: str):
+# Layer index tables by model folder, with the output signature they were read for
+_layers_indecies_cache: dict[Path, tuple[tuple, pd.DataFrame]] = {}
+_layers_indecies_cache_lock = threading.Lock()
+
+# Demo scripts by petromod home folder, found once since the folder is large
+_demo_scripts_cache: dict[str, Path] = {}
+_demo_scripts_cache_lock = threading.Lock()
+
+
+def get_model_output_signature(model_folder: Path) -> tuple:
+    """Signature of the files in the model folder that are not inputs"""
+    signature = []
+    for folder, subfolders, filenames in os.walk(model_folder):
+        if Path(folder) == model_folder:
+            subfolders[:] = [subfolder for subfolder in subfolders if subfolder not in MODEL_INPUT_FOLDERS]
+        for filename in filenames:
+            file_stat = os.stat(Path(folder, filename))
+            signature.append((os.path.join(folder, filename), file_stat.st_size, file_stat.st_mtime_ns))
+    return tuple(sorted(signature))
+
+
+def get_cached_layers_indecies(model_folder: Path) -> pd.DataFrame | None:
+    """Returns the cached layer table if the model output did not change"""
+    with _layers_indecies_cache_lock:
+        cached = _layers_indecies_cache.get(model_folder.resolve())
+    if cached is None:
+        return None
+    signature, layer_table = cached
+    if signature != get_model_output_signature(model_folder):
+        return None
+    return layer_table.copy()
+
+
+def set_cached_layers_indecies(model_folder: Path, layer_table: pd.DataFrame) -> None:
+    """Caches the layer table for the current model output"""
+    signature = get_model_output_signature(model_folder)
+    with _layers_indecies_cache_lock:
+        _layers_indecies_cache[model_folder.resolve()] = (signature, layer_table.copy())
+
+
+def get_demo_script(project: PetroModProject) -> Path:
+    """Returns the demo opensim script of the petromod installation of the project"""
+    petromod_home = project.petromod.environment["PM_HOME"]
+    with _demo_scripts_cache_lock:
+        if petromod_home not in _demo_scripts_cache:
+            demo_script = next(Path(petromod_home).rglob(DEMO_SCRIPT_NAME), None)
+            if demo_script is None:
+                raise FileNotFoundError(f"{DEMO_SCRIPT_NAME} was not found in {petromod_home}")
+            _demo_scripts_cache[petromod_home] = demo_script
+        return _demo_scripts_cache[petromod_home]
+
+
+def get_layers_indecies(project: PetroModProject, model_name: str, use_cache: bool = True):
     """Get layers indecies"""
-    log = project.run_script(
-        model_name=model_name,
-        script="demo_opensim_output_3rd_party_format.py",
-        script_folder_type="pmhome",
-        script_arguments="-1",
-    )
+    model_folder = project.get_model_folder(model_name)
+    if use_cache and model_folder is not None:
+        layer_table = get_cached_layers_indecies(model_folder)
+        if layer_table is not None:
+            return layer_table
+
+    with tempfile.TemporaryDirectory(prefix=SCRATCH_FOLDER_PREFIX) as scratch_folder:
+        log = project.run_script(
+            model_name=model_name,
+            script="demo_opensim_output_3rd_party_format.py",
+            script_folder_type="pmhome",
+            script_arguments="-1",
+            working_folder=Path(scratch_folder),
+        )
 
     lines = log.split("\n")
     lines = [line.strip() for line in lines]
@@ -29,21 +99,26 @@ def get_layers_indecies(project: PetroModProject, model_name: str):
         layers.append(line.split(maxsplit=1))
 
     layer_table = pd.DataFrame(data=layers, columns=["Index", "Layer"])
+    if model_folder is not None:
+        set_cached_layers_indecies(model_folder, layer_table)
     return layer_table
 
 
 def get_layer_data(project: PetroModProject, model_name: str, layer_index) -> tuple[str, str, pd.DataFrame]:
     """Gets the layer data using the demo script"""
-    log = project.run_script(
-        model_name=model_name,
-        script="demo_opensim_output_3rd_party_format.py",
-        script_folder_type="pmhome",
-        script_arguments=str(layer_index),
-    )
+    # The demo script writes its output to the working folder, so each call gets its own
+    with tempfile.TemporaryDirectory(prefix=SCRATCH_FOLDER_PREFIX) as scratch_folder:
+        log = project.run_script(
+            model_name=model_name,
+            script="demo_opensim_output_3rd_party_format.py",
+            script_folder_type="pmhome",
+            script_arguments=str(layer_index),
+            working_folder=Path(scratch_folder),
+        )
 
-    filename = Path("./demo_1.txt")
-    with open(filename, "r") as f:
-        lines = f.readlines()
+        filename = Path(scratch_folder, "demo_1.txt")
+        with open(filename, "r") as f:
+            lines = f.readlines()
 
     layer_name = lines[4].split(":")[1].strip()
     layer_unit = lines[5].split(":")[1].strip()
@@ -55,14 +130,60 @@ def get_layer_data(project: PetroModProject, model_name: str, layer_index) -> tu
     return layer_name, layer_unit, data
 
 
-def get_layer_data_table(project, model_name, layer_names) -> pd.DataFrame:
+def get_layers_data(
+    project: PetroModProject,
+    model_name: str,
+    layer_names: list[str],
+) -> dict[str, tuple[str, str, pd.DataFrame]]:
+    """Gets several layers with one runpmpy launch using the bundled export script"""
+    model_folder = project.get_model_folder(model_name)
+    with tempfile.TemporaryDirectory(prefix=SCRATCH_FOLDER_PREFIX) as scratch_folder:
+        with open(Path(scratch_folder, EXPORT_REQUEST_FILENAME), "w") as f:
+            json.dump({"layers": list(layer_names)}, f)
+
+        log = project.run_script(
+            model_name=model_name,
+            script=EXPORT_LAYERS_SCRIPT,
+            script_folder_type="none",
+            script_arguments=[str(get_demo_script(project))],
+            working_folder=Path(scratch_folder),
+        )
+
+        filename = Path(scratch_folder, EXPORT_OUTPUT_FILENAME)
+        if not filename.is_file():
+            raise FileNotFoundError(f"Layers could not be exported:\n{log}")
+        with open(filename, "r") as f:
+            export = json.load(f)
+
+    # The export contains the layer table as well
+    if model_folder is not None:
+        layer_table = pd.DataFrame(data=export["layers_indecies"], columns=["Index", "Layer"])
+        set_cached_layers_indecies(model_folder, layer_table)
+
+    layers_data = {}
+    for layer_name in layer_names:
+        if layer_name not in export["layers"]:
+            raise LookupError(f"Layer {layer_name} was not found")
+        layer = export["layers"][layer_name]
+        data = pd.DataFrame(data=layer["data"], columns=["Element", "Value"])
+        layers_data[layer_name] = (layer["name"], layer["unit"], data)
+    return layers_data
+
+
+def get_layer_data_table(project, model_name, layer_names, batched: bool = True) -> pd.DataFrame:
     """Get data quickly"""
     layer_data_dict = {}
-    output_layter_table = get_layers_indecies(project, model_name)
-    for layer_name in layer_names:
-        layer_index = output_layter_table[output_layter_table["Layer"] == layer_name]["Index"].values[0]
-        column_values = get_layer_data(project, model_name, layer_index)[2].values[:, 1]
-        layer_data_dict[layer_name] = np.flip(column_values)
+    if batched:
+        layers_data = get_layers_data(project, model_name, layer_names)
+        for layer_name in layer_names:
+            column_values = layers_data[layer_name][2].values[:, 1]
+            layer_data_dict[layer_name] = np.flip(column_values)
+    else:
+        output_layter_table = get_layers_indecies(project, model_name)
+        for layer_name in layer_names:
+            layer_index = output_layter_table[output_layter_table["Layer"] == layer_name]["Index"].values[0]
+            column_values = get_layer_data(project, model_name, layer_index)[2].values[:, 1]
+            layer_data_dict[layer_name] = np.flip(column_values)
 
     data_table = pd.DataFrame(layer_data_dict).astype(float)
     return data_table
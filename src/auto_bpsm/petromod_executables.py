@@ -1,11 +1,26 @@
+from dataclasses import dataclass
 from typing import Literal, Optional
 from pathlib import Path
+import asyncio
+import locale
 import os
+import shlex
+import signal
 import subprocess
+import time
 
 PETROMOD_DEFAULT_PARENT_FOLDER = Path(r"C:\Program Files\Schlumberger")
 
 
+@dataclass
+class CommandResult:
+    """Outcome of an executable call"""
+
+    log: str
+    return_code: int
+    wall_time: float
+
+
 class PetroMod:
     petromod_binary_folder: Path
 
@@ -27,32 +42,199 @@ class PetroMod:
         if self.petromod_binary_folder is None:
             raise FileNotFoundError()
 
+    @property
+    def environment(self) -> dict[str, str]:
+        """Environment for the petromod executables"""
+        environment = os.environ.copy()
+        environment["PM_HOME"] = str(self.petromod_binary_folder.parent.parent)
+        return environment
+
+    def hermes_arguments(self, model_folder: Path) -> list[str]:
+        """Argument list to run a model"""
+        hermes_filename = Path(self.petromod_binary_folder, "hermes.exe")
+        return [str(hermes_filename), "-model", str(model_folder.resolve())]
+
+    def pmpy_arguments(
+        self,
+        model_folder: Path,
+        script: Path | str,
+        script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
+        script_arguments: str | list[str] = "",
+    ) -> list[str]:
+        """Argument list to call a python script"""
+        pmpy_filename = Path(self.petromod_binary_folder, "runpmpy.exe")
+        if isinstance(script_arguments, str):
+            script_arguments = PetroMod.split_arguments(script_arguments)
+        arguments = [str(pmpy_filename), "-m", str(model_folder.resolve())]
+        arguments.extend(["-scriptdir", script_folder_type, "-script", str(script)])
+        arguments.extend([str(argument) for argument in script_arguments])
+        return arguments
+
+    @staticmethod
+    def split_arguments(arguments: str) -> list[str]:
+        """Splits an argument string like a shell, quoted arguments may hold spaces"""
+        if os.name != "nt":
+            return shlex.split(arguments)
+
+        # Windows paths keep their backslashes, the quotes are removed as the argument list quotes again
+        return [
+            argument[1:-1] if len(argument) >= 2 and argument[0] == argument[-1] and argument[0] in "\"'" else argument
+            for argument in shlex.split(arguments, posix=False)
+        ]
+
     def call_hermes(self, model_folder: Path):
         """Runs a model"""
-        hermes_filename = Path(self.petromod_binary_folder, "hermes.exe")
-        command = f'"{str(hermes_filename)}" -model "{str(model_folder.resolve())}"'
-        log = PetroMod.run_command(command)
-        return log
+        return self.execute_hermes(model_folder).log
+
+    def execute_hermes(self, model_folder: Path, timeout: float = None) -> CommandResult:
+        """Runs a model and returns the log, exit code and wall time"""
+        arguments = self.hermes_arguments(model_folder)
+        return PetroMod.execute_command(arguments, self.environment, timeout=timeout)
+
+    async def call_hermes_async(self, model_folder: Path, timeout: float = None) -> CommandResult:
+        """Runs a model without blocking the event loop"""
+        arguments = self.hermes_arguments(model_folder)
+        return await PetroMod.execute_command_async(arguments, self.environment, timeout)
 
     def call_pmpy(
         self,
         model_folder: Path,
         script: Path | str,
         script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
-        script_arguments: str = "",
+        script_arguments: str | list[str] = "",
+        working_folder: Path = None,
     ):
         """Call a python script"""
-        os.environ["PM_HOME"] = str(self.petromod_binary_folder.parent.parent)
-        pmpy_filename = Path(self.petromod_binary_folder, "runpmpy.exe")
-        command = f'"{str(pmpy_filename)}" -m "{str(model_folder.resolve())}" -scriptdir {script_folder_type} -script "{str(script)}" {str(script_arguments)}'
-        log = PetroMod.run_command(command)
-        return log
+        return self.execute_pmpy(model_folder, script, script_folder_type, script_arguments, working_folder).log
+
+    def execute_pmpy(
+        self,
+        model_folder: Path,
+        script: Path | str,
+        script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
+        script_arguments: str | list[str] = "",
+        working_folder: Path = None,
+        timeout: float = None,
+    ) -> CommandResult:
+        """Call a python script and returns the log, exit code and wall time"""
+        arguments = self.pmpy_arguments(model_folder, script, script_folder_type, script_arguments)
+        return PetroMod.execute_command(arguments, self.environment, working_folder, timeout)
+
+    async def call_pmpy_async(
+        self,
+        model_folder: Path,
+        script: Path | str,
+        script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
+        script_arguments: str | list[str] = "",
+        timeout: float = None,
+        working_folder: Path = None,
+    ) -> CommandResult:
+        """Call a python script without blocking the event loop"""
+        arguments = self.pmpy_arguments(model_folder, script, script_folder_type, script_arguments)
+        return await PetroMod.execute_command_async(arguments, self.environment, timeout, working_folder)
 
     @staticmethod
-    def run_command(command: str) -> str:
+    def run_command(
+        command: str | list[str],
+        environment: dict[str, str] = None,
+        working_folder: Path = None,
+    ) -> str:
         """Runs a commmand"""
-        log = subprocess.getoutput(f"{command}")
-        return log
+        return PetroMod.execute_command(command, environment, working_folder).log
+
+    @staticmethod
+    def start_process(
+        command: str | list[str],
+        environment: dict[str, str] = None,
+        working_folder: Path = None,
+    ) -> subprocess.Popen:
+        """Starts a command in its own process group so it can be killed with the processes it starts"""
+        return subprocess.Popen(
+            command,
+            shell=isinstance(command, str),
+            env=environment,
+            cwd=working_folder,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            **PetroMod.get_process_group_options(),
+        )
+
+    @staticmethod
+    def get_process_group_options() -> dict:
+        """Popen options that start a process in its own process group, callers kill it when they are interrupted"""
+        if os.name == "nt":
+            return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        return {"start_new_session": True}
+
+    @staticmethod
+    def kill_process_tree(pid: int) -> None:
+        """Kills a process started by start_process and the processes it started"""
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        else:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    @staticmethod
+    def execute_command(
+        command: str | list[str],
+        environment: dict[str, str] = None,
+        working_folder: Path = None,
+        timeout: float = None,
+    ) -> CommandResult:
+        """Runs a command, through the shell if it is a string, and keeps its exit code and wall time"""
+        start_time = time.perf_counter()
+        process = PetroMod.start_process(command, environment, working_folder)
+        try:
+            raw_log, _ = process.communicate(timeout=timeout)
+        except BaseException:
+            # The process is in its own session, so an interrupt or timeout does not reach it
+            PetroMod.kill_process_tree(process.pid)
+            process.communicate()
+            raise
+        wall_time = time.perf_counter() - start_time
+
+        # Same log as subprocess.getoutput
+        log = raw_log.removesuffix("\n")
+        return CommandResult(log=log, return_code=process.returncode, wall_time=wall_time)
+
+    @staticmethod
+    async def execute_command_async(
+        arguments: list[str],
+        environment: dict[str, str] = None,
+        timeout: float = None,
+        working_folder: Path = None,
+    ) -> CommandResult:
+        """Runs an argument list as a subprocess of the running event loop"""
+        start_time = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *arguments,
+            env=environment,
+            cwd=working_folder,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            **PetroMod.get_process_group_options(),
+        )
+        try:
+            raw_log, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except BaseException:
+            # Also on cancellation, the process is in its own session
+            PetroMod.kill_process_tree(process.pid)
+            await asyncio.shield(process.wait())
+            raise
+        wall_time = time.perf_counter() - start_time
+
+        log = raw_log.decode(locale.getpreferredencoding(False), errors="replace")
+        log = log.replace("\r\n", "\n").removesuffix("\n")
+        return CommandResult(log=log, return_code=process.returncode, wall_time=wall_time)
 
     @staticmethod
     def get_petromod_folders(petromod_parent_folder: Path = PETROMOD_DEFAULT_PARENT_FOLDER) -> Optional[list[Path]]:
@@ -1,10 +1,12 @@
 from pathlib import Path
 from auto_bpsm.file_formats.lithology_catalogue import LithologyCatalogue
+from auto_bpsm.file_formats.lithology_extras.litho import Lithology
 from auto_bpsm.file_formats.pmt import PetroModTable
 from auto_bpsm.file_formats.pma import PetroModASCII
+from auto_bpsm.snapshot_cache import SnapshotCache
 
 IN_FILENAMES = {
-    "mckenzie_heat_flow_options": "mckenzie/riftphases.pmt",
+    "mckenzie_rift_phases": "mckenzie/riftphases.pmt",
     "global_coordinates": "ggxy.pmt",
     "heat_flow": "in1d_hf.pmt",
     "paleowater_depth": "in1d_pwd.pmt",
@@ -21,6 +23,12 @@ DEF_FILENAMES = {
     "simulation_options": "proj.pma",
 }
 
+# Model subfolders read by the simulator, the others hold outputs
+MODEL_INPUT_FOLDERS = ("in", "def")
+
+# Deposition history columns that reference lithologies, by name or id
+LITHOLOGY_COLUMN_KEYWORD = "lithology"
+
 
 class PetroModModel:
     """PetroMod model"""
@@ -35,6 +43,7 @@ class OneDimensionalModel:
     # Model
     model_name: str
     model_folder: Path
+    snapshot_cache: SnapshotCache = None
 
     # Options
     mckenzie_heat_flow_options: PetroModASCII
@@ -52,30 +61,74 @@ class OneDimensionalModel:
     auto_sediment_water_interface_temperature: PetroModTable
     well_assignment: PetroModTable
 
-    def __init__(self, model_folder: Path):
-        """Loads a model"""
+    def __init__(self, model_folder: Path, snapshot_cache: SnapshotCache = None):
+        """Loads a model, the input files are read on first access"""
         self.model_name = model_folder.name
         self.model_folder = model_folder
-
-        for variable, file in IN_FILENAMES.items():
-            filename = Path(self.model_folder, "in", file)
-            self.__setattr__(variable, PetroModTable.read_file(filename))
-
-        for variable, file in DEF_FILENAMES.items():
-            filename = Path(self.model_folder, "def", file)
-            self.__setattr__(variable, PetroModASCII.read_file(filename))
-
-    def save_model(self):
-        """Saves the model back"""
-        for variable, file in IN_FILENAMES.items():
-            filename = Path(self.model_folder, "in", file)
-            pmt: PetroModTable = self.__getattribute__(variable)
-            pmt.write_file(filename)
-
-        for variable, file in DEF_FILENAMES.items():
-            filename = Path(self.model_folder, "def", file)
-            pma: PetroModASCII = self.__getattribute__(variable)
-            pma.write_file(filename)
+        self.snapshot_cache = snapshot_cache
+
+    def __getattr__(self, variable: str):
+        """Reads an input file the first time it is accessed"""
+        if variable not in IN_FILENAMES and variable not in DEF_FILENAMES:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{variable}'")
+        petromod_file = self.read_input_file(variable)
+        self.__dict__[variable] = petromod_file
+        return petromod_file
+
+    def get_input_filename(self, variable: str) -> Path:
+        """Returns the file of an input variable"""
+        if variable in IN_FILENAMES:
+            return Path(self.model_folder, "in", IN_FILENAMES[variable])
+        return Path(self.model_folder, "def", DEF_FILENAMES[variable])
+
+    def read_input_file(self, variable: str) -> PetroModTable | PetroModASCII | None:
+        """Reads an input file, missing files are returned as None"""
+        filename = self.get_input_filename(variable)
+        if not filename.is_file():
+            return None
+        read_function = PetroModTable.read_file if variable in IN_FILENAMES else PetroModASCII.read_file
+        if self.snapshot_cache is not None:
+            return self.snapshot_cache.load(filename, read_function)
+        return read_function(filename)
+
+    def replace_lithologies(self, lithology_pairs: list[tuple[Lithology, Lithology]]) -> None:
+        """Points the deposition history from the first lithology of each pair, by id or name, to the second"""
+        replacements = {}
+        for source_lithology, lithology in lithology_pairs:
+            replacements[source_lithology.id] = lithology.id
+            replacements[source_lithology.name] = lithology.name
+
+        # Only the lithology columns, layers and other names may match a lithology name
+        table = self.depostion_history.table
+        column_indices = [
+            column_index
+            for column_index, column_name in enumerate(table.columns)
+            if LITHOLOGY_COLUMN_KEYWORD in str(column_name).lower()
+        ]
+        if len(column_indices) == 0:
+            raise LookupError("The deposition history has no lithology column")
+        for column_index in column_indices:
+            column = table.iloc[:, column_index]
+            table.isetitem(column_index, column.map(lambda value: replacements.get(value, value)))
+
+    @property
+    def loaded_variables(self) -> list[str]:
+        """Returns the input variables that were read"""
+        variables = [*IN_FILENAMES, *DEF_FILENAMES]
+        return [variable for variable in variables if self.__dict__.get(variable) is not None]
+
+    @property
+    def modified_variables(self) -> list[str]:
+        """Returns the input variables that changed since they were read or saved"""
+        return [variable for variable in self.loaded_variables if self.__dict__[variable].is_modified]
+
+    def save_model(self, force: bool = False):
+        """Saves the model back, only the files that changed unless forced"""
+        variables = self.loaded_variables if force else self.modified_variables
+        for variable in variables:
+            filename = self.get_input_filename(variable)
+            petromod_file: PetroModTable | PetroModASCII = self.__dict__[variable]
+            petromod_file.write_file(filename)
 
 
 class TwoDimensionalModel:
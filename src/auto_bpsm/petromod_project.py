@@ -1,10 +1,21 @@
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
 from typing import Annotated, Literal
+import os
 import shutil
+import stat
+import subprocess
+import threading
 from auto_bpsm.file_formats.lithology_catalogue import LithologyCatalogue
-from auto_bpsm.petromod_executables import PetroMod
+from auto_bpsm.file_formats.lithology_extras.litho import Lithology
+from auto_bpsm.petromod_executables import CommandResult, PetroMod
 from auto_bpsm.petromod_models import OneDimensionalModel, TwoDimensionalModel, ThreeDimensionalModel, PetroModModel
+from auto_bpsm.petromod_models import DEF_FILENAMES, IN_FILENAMES, MODEL_INPUT_FOLDERS
+from auto_bpsm.snapshot_cache import SnapshotCache
+from auto_bpsm.utilities import link_or_copy
 
 
 @dataclass
@@ -23,41 +34,204 @@ class PetroModProject:
     project_folder: Path
     lithology_catalouge: LithologyCatalogue = None
     petromod: PetroMod
+    snapshot_cache: SnapshotCache = None
 
-    def __init__(self, project_folder: Path, petromod: PetroMod = None, petromod_folder_index: int = 0):
-        """Initializes the project"""
+    # Model folders by name for each dimension, with the modification time they were listed at
+    _model_index: dict[int, tuple[int, dict[str, Path]]]
+
+    def __init__(
+        self,
+        project_folder: Path,
+        petromod: PetroMod = None,
+        petromod_folder_index: int = 0,
+        snapshot_folder: Path | None = None,
+    ):
+        """Initializes the project, parsed files are cached in the snapshot folder if given (opt-in)"""
         self.project_folder = project_folder
         self.petromod = petromod if petromod else PetroMod(petromod_folder_index=petromod_folder_index)
+        self.snapshot_cache = SnapshotCache.create(snapshot_folder)
+        self._model_index = {}
+        self._model_index_lock = threading.Lock()
+        self._model_changes = 0
 
     def duplicate_model(
         self,
         source_model_name: str,
         distination_model_name: str,
         model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        inputs_only: bool = False,
+        link_inputs: bool = False,
     ) -> None:
-        """creates a copy of a model"""
+        """creates a copy of a model, only the simulation inputs if inputs_only, see copy_model_file for link_inputs"""
         source_folder = self.get_model_folder(source_model_name, model_dimension)
         if source_folder is None:
             return None
         distination_folder = Path(source_folder.parent, distination_model_name)
-        shutil.copytree(source_folder, distination_folder)
+        previous_modification_time = self.start_model_change(source_folder.parent)
+        try:
+            if inputs_only:
+                PetroModProject.copy_model_inputs(source_folder, distination_folder, link_inputs)
+            else:
+                shutil.copytree(source_folder, distination_folder)
+        finally:
+            self.finish_model_change(distination_folder, previous_modification_time)
+
+    def duplicate_models(
+        self,
+        source_model_name: str,
+        distination_model_names: list[str],
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        inputs_only: bool = True,
+        max_workers: int = None,
+        link_inputs: bool = False,
+    ) -> None:
+        """Creates several copies of a model concurrently"""
+        if max_workers is None:
+            max_workers = os.cpu_count()
+
+        source_folder = self.get_model_folder(source_model_name, model_dimension)
+        if source_folder is None:
+            return None
+        model_dimension = int(str(source_folder.parent.name)[2])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.duplicate_model,
+                    source_model_name,
+                    distination_model_name,
+                    model_dimension,
+                    inputs_only,
+                    link_inputs,
+                )
+                for distination_model_name in distination_model_names
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+    @staticmethod
+    def list_model_inputs(model_folder: Path) -> list[Path]:
+        """Returns the top level files and the input files of a model, relative to the model folder"""
+        relative_filenames = [Path(filename.name) for filename in model_folder.iterdir() if filename.is_file()]
+        for input_folder in MODEL_INPUT_FOLDERS:
+            for folder, _subfolders, filenames in os.walk(Path(model_folder, input_folder)):
+                relative_folder = Path(folder).relative_to(model_folder)
+                relative_filenames.extend([Path(relative_folder, filename) for filename in filenames])
+        return relative_filenames
+
+    @staticmethod
+    def copy_model_file(
+        source_folder: Path,
+        distination_folder: Path,
+        relative_filename: Path,
+        link_inputs: bool = False,
+    ) -> None:
+        """Copies a model file, if link_inputs the inputs the toolbox does not edit are hardlinks made read-only"""
+        edited_filenames = {Path("in", filename) for filename in IN_FILENAMES.values()}
+        edited_filenames.update([Path("def", filename) for filename in DEF_FILENAMES.values()])
+
+        source_filename = Path(source_folder, relative_filename)
+        distination_filename = Path(distination_folder, relative_filename)
+        distination_filename.parent.mkdir(parents=True, exist_ok=True)
+        if not link_inputs or relative_filename in edited_filenames or len(relative_filename.parts) == 1:
+            shutil.copy2(source_filename, distination_filename)
+            return
+
+        # A write in place through a link would change the source and every copy, so the shared file is read-only
+        link_or_copy(source_filename, distination_filename)
+        file_mode = stat.S_IMODE(os.stat(distination_filename).st_mode)
+        os.chmod(distination_filename, file_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    @staticmethod
+    def copy_model_inputs(source_folder: Path, distination_folder: Path, link_inputs: bool = False) -> None:
+        """Copies the inputs of a model and skips the outputs, see copy_model_file for link_inputs"""
+        distination_folder.mkdir()
+        for input_folder in MODEL_INPUT_FOLDERS:
+            for folder, _subfolders, _filenames in os.walk(Path(source_folder, input_folder)):
+                Path(distination_folder, Path(folder).relative_to(source_folder)).mkdir(parents=True, exist_ok=True)
+        for relative_filename in PetroModProject.list_model_inputs(source_folder):
+            PetroModProject.copy_model_file(source_folder, distination_folder, relative_filename, link_inputs)
+
+    def create_model_pool(
+        self,
+        template_model_name: str,
+        pool_size: int,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ):
+        """Creates working copies of a model that trials check out and return"""
+        # Imported here as the pool module depends on the project
+        from auto_bpsm.model_pool import ModelPool
+
+        return ModelPool(self, template_model_name, pool_size, model_dimension)
+
+    def create_shards(self, shard_count: int, model_names: list[str], shards_folder: Path = None):
+        """Creates clones of the project that use their own lithology catalogue and copies of the models"""
+        # Imported here as the shards module depends on the project
+        from auto_bpsm.project_shards import ProjectShards
+
+        return ProjectShards(self, shard_count, model_names, shards_folder)
+
+    def get_model_index(self, model_dimension: Annotated[int, ValueRange(1, 3)]) -> Mapping[str, Path]:
+        """Returns a read-only view of the model folders of a dimension, listed again only if the folder changed"""
+        models_folder = Path(self.project_folder, MODEL_FOLDER_DICTIONARY[f"{str(model_dimension)}D"])
+        try:
+            modification_time = os.stat(models_folder).st_mtime_ns
+        except FileNotFoundError:
+            return MappingProxyType({})
+
+        with self._model_index_lock:
+            index_entry = self._model_index.get(model_dimension)
+        if index_entry is not None and index_entry[0] == modification_time:
+            return MappingProxyType(index_entry[1])
+
+        # The time is read before listing, so changes made while listing are listed again next time
+        with os.scandir(models_folder) as entries:
+            models = {entry.name: Path(models_folder, entry.name) for entry in entries}
+        with self._model_index_lock:
+            self._model_index[model_dimension] = (modification_time, models)
+        return MappingProxyType(models)
+
+    def start_model_change(self, models_folder: Path) -> int:
+        """Counts a model being added or removed, returns the modification time before the change"""
+        with self._model_index_lock:
+            self._model_changes = self._model_changes + 1
+        return os.stat(models_folder).st_mtime_ns
+
+    def finish_model_change(self, model_folder: Path, previous_modification_time: int) -> None:
+        """Updates the index with a model that was added or removed"""
+        model_dimension = int(str(model_folder.parent.name)[2])
+        modification_time = os.stat(model_folder.parent).st_mtime_ns
+        with self._model_index_lock:
+            self._model_changes = self._model_changes - 1
+            index_entry = self._model_index.get(model_dimension)
+            if index_entry is None:
+                return
+
+            # The listed models are replaced rather than changed, as callers read them without the lock
+            models = dict(index_entry[1])
+            if model_folder.exists():
+                models[model_folder.name] = model_folder
+            else:
+                models.pop(model_folder.name, None)
+
+            # The new time is only kept if no other change happened meanwhile, otherwise the folder is listed again
+            if index_entry[0] == previous_modification_time and self._model_changes == 0:
+                self._model_index[model_dimension] = (modification_time, models)
+            else:
+                self._model_index[model_dimension] = (index_entry[0], models)
 
     def list_models(self) -> dict[str, list[str]]:
         """List the models available in the project"""
         models_dict = {}
-        for key, model_folder_name in MODEL_FOLDER_DICTIONARY.items():
-            models_folder = Path(self.project_folder, model_folder_name)
-            models_raw_filenames = list(models_folder.iterdir())
-            models = [file.name for file in models_raw_filenames]
-            models_dict[key] = models
+        for i, key in enumerate(MODEL_FOLDER_DICTIONARY):
+            models_dict[key] = list(self.get_model_index(i + 1))
         return models_dict
 
     def guess_model_dimension(self, model_name: str):
         """Returns teh model dimensions"""
-        models_dict = self.list_models()
         possible_dimensions = []
-        for i, (key, models) in enumerate(models_dict.items()):
-            if model_name in models:
+        for i in range(len(MODEL_FOLDER_DICTIONARY)):
+            if model_name in self.get_model_index(i + 1):
                 possible_dimensions.append(i + 1)
 
         if len(possible_dimensions) != 1:
@@ -72,34 +246,42 @@ class PetroModProject:
             print("Model could not be found or there are multiple models with the same name.")
             return None
 
-        models_folder = MODEL_FOLDER_DICTIONARY[f"{str(model_dimension)}D"]
-        model_folder = Path(self.project_folder, models_folder, model_name)
-        if not model_folder.is_dir():
-            return None
-        return model_folder
+        return self.get_model_index(model_dimension).get(model_name)
 
     def load_model(self, model_name: str, model_dimension: Annotated[int, ValueRange(1, 3)] = None) -> PetroModModel:
         """Loads a model"""
         # Model dimension
         model_folder = self.get_model_folder(model_name, model_dimension)
-        model_dimension = int(str(model_folder.parent.name)[2])
         if model_folder is None:
             return None
+        model_dimension = int(str(model_folder.parent.name)[2])
         model_class = MODEL_CLASS_DICTIONARY[model_dimension]
+        if model_class is OneDimensionalModel:
+            return model_class(model_folder, self.snapshot_cache)
         return model_class(model_folder)
 
-    def load_lithology(self) -> LithologyCatalogue:
-        """Load lithology file"""
+    def load_lithology(self, lithologies: list[str] = None) -> LithologyCatalogue:
+        """Load lithology file, only the given lithologies and what they reference if provided"""
 
-        # Return it if it is already loaded
-        if self.lithology_catalouge:
+        # Return it if it is already loaded, a partial catalogue does not do for a full load
+        if self.lithology_catalouge and lithologies is None and not self.lithology_catalouge.is_partial:
             return self.lithology_catalouge
+        if self.lithology_catalouge and not self.lithology_catalouge.is_saved():
+            raise RuntimeError("The loaded lithology catalogue has unsaved edits, save it before loading it again")
 
         lithology_filename = Path(self.project_folder, "geo", "Lithologies.xml")
-        self.lithology_catalouge = LithologyCatalogue.read_catalogue_file(lithology_filename)
+        if self.snapshot_cache is None:
+            self.lithology_catalouge = LithologyCatalogue.read_catalogue_file(lithology_filename, lithologies)
+        else:
+            variant = "" if lithologies is None else "|".join(sorted(lithologies))
+            self.lithology_catalouge = self.snapshot_cache.load(
+                lithology_filename,
+                lambda filename: LithologyCatalogue.read_catalogue_file(filename, lithologies),
+                variant,
+            )
         return self.lithology_catalouge
 
-    def save_lithology(self) -> None:
+    def save_lithology(self, incremental: bool = False) -> None:
         """Saves teh lithology file back"""
 
         # Stopping condition
@@ -107,31 +289,112 @@ class PetroModProject:
             return
         # Write lihology file
         lithology_filename = Path(self.project_folder, "geo", "Lithologies.xml")
-        self.lithology_catalouge.write_catalogue_file(lithology_filename)
+        self.lithology_catalouge.write_catalogue_file(lithology_filename, incremental)
+
+    def create_lithology_realizations(
+        self,
+        source_model_name: str,
+        realization_names: list[str],
+        lithologies: list[str],
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ) -> dict[str, list[tuple[Lithology, Lithology]]]:
+        """Creates a copy of the model for each realization that uses its own variants of the lithologies"""
+        lithology_catalogue = self.load_lithology()
+        variants = lithology_catalogue.create_lithology_variants(lithologies, realization_names)
+        self.duplicate_models(source_model_name, realization_names, model_dimension, inputs_only=True)
+        for realization_name in realization_names:
+            model = self.load_model(realization_name, model_dimension)
+            model.replace_lithologies(variants[realization_name])
+            model.save_model()
+
+        # The catalogue is written once for all the realizations
+        self.save_lithology(incremental=True)
+        return variants
+
+    def delete_lithology_realizations(
+        self,
+        variants: dict[str, list[tuple[Lithology, Lithology]]],
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ) -> None:
+        """Deletes the models and the lithology variants of create_lithology_realizations"""
+        for realization_name in variants:
+            self.delete_model(realization_name, model_dimension)
+        self.load_lithology().delete_lithology_variants(variants)
+        self.save_lithology(incremental=True)
 
     def delete_model(self, model_name: str, model_dimension: Annotated[int, ValueRange(1, 3)] = None):
         """Deletes a model"""
         model_folder = self.get_model_folder(model_name, model_dimension)
         if model_folder is None:
             return None
-        shutil.rmtree(model_folder)
+        previous_modification_time = self.start_model_change(model_folder.parent)
+        try:
+            shutil.rmtree(model_folder)
+        finally:
+            self.finish_model_change(model_folder, previous_modification_time)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.prune(model_folder)
 
-    def run_model(self, model_name: str, model_dimension: Annotated[int, ValueRange(1, 3)] = None) -> str | None:
-        """Runs a model"""
+    def run_model(
+        self,
+        model_name: str,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        check: bool = False,
+    ) -> str | None:
+        """Runs a model, raises CalledProcessError if check and the simulation failed"""
         # Model dimension
         model_folder = self.get_model_folder(model_name, model_dimension)
         if model_folder is None:
             return None
-        log = self.petromod.call_hermes(model_folder)
-        return log
+        command_result = self.petromod.execute_hermes(model_folder)
+        if check and command_result.return_code != 0:
+            raise subprocess.CalledProcessError(command_result.return_code, "hermes", command_result.log)
+        return command_result.log
+
+    def run_models(
+        self,
+        model_names: list[str],
+        max_workers: int = None,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ) -> dict[str, CommandResult | None]:
+        """Runs several models concurrently, at most max_workers at a time"""
+        if max_workers is None:
+            max_workers = os.cpu_count()
+
+        # Models that cannot be found are reported as None
+        results = {model_name: None for model_name in model_names}
+        model_folders = {model_name: self.get_model_folder(model_name, model_dimension) for model_name in model_names}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.petromod.execute_hermes, model_folder): model_name
+                for model_name, model_folder in model_folders.items()
+                if model_folder is not None
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+
+    async def run_model_async(
+        self,
+        model_name: str,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        timeout: float = None,
+    ) -> CommandResult | None:
+        """Runs a model without blocking the event loop"""
+        model_folder = self.get_model_folder(model_name, model_dimension)
+        if model_folder is None:
+            return None
+        return await self.petromod.call_hermes_async(model_folder, timeout)
 
     def run_script(
         self,
         script: Path,
         model_name: str,
         script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
-        script_arguments: str = "",
+        script_arguments: str | list[str] = "",
         model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        working_folder: Path = None,
     ) -> str | None:
         """Runs the script"""
         model_folder = self.get_model_folder(model_name, model_dimension)
@@ -142,5 +405,29 @@ class PetroModProject:
             script=script,
             script_folder_type=script_folder_type,
             script_arguments=script_arguments,
+            working_folder=working_folder,
         )
         return log
+
+    async def run_script_async(
+        self,
+        script: Path,
+        model_name: str,
+        script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
+        script_arguments: str | list[str] = "",
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+        timeout: float = None,
+        working_folder: Path = None,
+    ) -> CommandResult | None:
+        """Runs the script without blocking the event loop"""
+        model_folder = self.get_model_folder(model_name, model_dimension)
+        if model_folder is None:
+            return None
+        return await self.petromod.call_pmpy_async(
+            model_folder=model_folder,
+            script=script,
+            script_folder_type=script_folder_type,
+            script_arguments=script_arguments,
+            timeout=timeout,
+            working_folder=working_folder,
+        )
@@ -0,0 +1,121 @@
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import queue
+import shutil
+from auto_bpsm.petromod_project import MODEL_FOLDER_DICTIONARY, PetroModProject
+from auto_bpsm.utilities import link_or_copy
+
+LITHOLOGY_FILENAME = Path("geo", "Lithologies.xml")
+SHARDS_FOLDER_SUFFIX = "_shards"
+
+
+class ProjectShards:
+    """Lightweight clones of a project, each with its own lithology catalogue"""
+
+    project: PetroModProject
+    shards_folder: Path
+    model_names: list[str]
+    shard_projects: list[PetroModProject]
+
+    def __init__(
+        self,
+        project: PetroModProject,
+        shard_count: int,
+        model_names: list[str],
+        shards_folder: Path = None,
+        max_workers: int = None,
+    ):
+        """Creates the clones, only the catalogue and the inputs of the models are copied"""
+        if shards_folder is None:
+            shards_folder = Path(project.project_folder.parent, project.project_folder.name + SHARDS_FOLDER_SUFFIX)
+        if max_workers is None:
+            max_workers = os.cpu_count()
+
+        model_folders = []
+        for model_name in model_names:
+            model_folder = project.get_model_folder(model_name)
+            if model_folder is None:
+                raise FileNotFoundError(f"Model {model_name} was not found")
+            model_folders.append(model_folder)
+
+        self.project = project
+        self.shards_folder = shards_folder
+        self.model_names = list(model_names)
+        shard_folders = [Path(shards_folder, f"{project.project_folder.name}_{i}") for i in range(shard_count)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(ProjectShards.create_shard, project.project_folder, shard_folder, model_folders)
+                for shard_folder in shard_folders
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+        snapshot_folder = project.snapshot_cache.snapshot_folder if project.snapshot_cache is not None else None
+        self.shard_projects = [
+            PetroModProject(shard_folder, project.petromod, snapshot_folder=snapshot_folder)
+            for shard_folder in shard_folders
+        ]
+        self._available = queue.Queue()
+        for shard_project in self.shard_projects:
+            self._available.put(shard_project)
+
+    def __enter__(self) -> "ProjectShards":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.remove()
+
+    @staticmethod
+    def create_shard(project_folder: Path, shard_folder: Path, model_folders: list[Path]) -> None:
+        """Hardlinks the project files, copies the catalogue and the inputs of the models"""
+        model_parent_folders = [Path(model_folder_name) for model_folder_name in MODEL_FOLDER_DICTIONARY.values()]
+        for folder, subfolders, filenames in os.walk(project_folder):
+            relative_folder = Path(folder).relative_to(project_folder)
+            Path(shard_folder, relative_folder).mkdir(parents=True, exist_ok=True)
+
+            # Models are not linked, the ones in use are copied below
+            if relative_folder in model_parent_folders:
+                subfolders[:] = []
+            for filename in filenames:
+                relative_filename = Path(relative_folder, filename)
+                if relative_filename == LITHOLOGY_FILENAME:
+                    shutil.copy2(Path(project_folder, relative_filename), Path(shard_folder, relative_filename))
+                else:
+                    link_or_copy(Path(project_folder, relative_filename), Path(shard_folder, relative_filename))
+
+        for model_parent_folder in model_parent_folders:
+            Path(shard_folder, model_parent_folder).mkdir(exist_ok=True)
+        for model_folder in model_folders:
+            distination_folder = Path(shard_folder, model_folder.relative_to(project_folder))
+            PetroModProject.copy_model_inputs(model_folder, distination_folder)
+
+    @contextmanager
+    def checkout(self, timeout: float = None) -> Iterator[PetroModProject]:
+        """Lends a shard project, waiting if all are in use"""
+        shard_project = self._available.get(timeout=timeout)
+        try:
+            yield shard_project
+        finally:
+            self._available.put(shard_project)
+
+    def merge_model(self, shard_project: PetroModProject, model_name: str, distination_model_name: str) -> Path:
+        """Moves a model of a shard, with its results, into the main project and puts a fresh copy in the shard"""
+        source_folder = shard_project.get_model_folder(model_name)
+        if source_folder is None:
+            raise FileNotFoundError(f"Model {model_name} was not found")
+        distination_folder = Path(self.project.project_folder, source_folder.parent.name, distination_model_name)
+        if distination_folder.exists():
+            raise FileExistsError(f"Model {distination_model_name} already exists")
+
+        shutil.move(source_folder, distination_folder)
+        template_folder = Path(self.project.project_folder, source_folder.relative_to(shard_project.project_folder))
+        PetroModProject.copy_model_inputs(template_folder, source_folder)
+        return distination_folder
+
+    def remove(self) -> None:
+        """Deletes the shards"""
+        if self.shards_folder.is_dir():
+            shutil.rmtree(self.shards_folder)
@@ -0,0 +1,278 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import math
+import sqlite3
+import time
+import pandas as pd
+
+DATABASE_TIMEOUT = 60.0
+PARAMETER_NAME_SEPARATOR = "_"
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+CREATE_TABLE_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS realizations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        study TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        heat_flow REAL,
+        status TEXT NOT NULL,
+        start_time REAL NOT NULL,
+        wall_time REAL,
+        error TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS parameters (
+        realization_id INTEGER NOT NULL REFERENCES realizations (id),
+        lithology TEXT NOT NULL,
+        parameter TEXT NOT NULL,
+        value REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS misfits (
+        realization_id INTEGER NOT NULL REFERENCES realizations (id),
+        name TEXT NOT NULL,
+        value REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS results (
+        realization_id INTEGER PRIMARY KEY REFERENCES realizations (id),
+        results_table TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS realizations_study ON realizations (study, status)",
+    "CREATE INDEX IF NOT EXISTS parameters_realization ON parameters (realization_id)",
+    "CREATE INDEX IF NOT EXISTS parameters_value ON parameters (lithology, parameter, value)",
+    "CREATE INDEX IF NOT EXISTS misfits_realization ON misfits (realization_id)",
+    "CREATE INDEX IF NOT EXISTS misfits_value ON misfits (name, value)",
+]
+
+
+class RealizationLedger:
+    """Append only SQLite record of the sampled parameters, runs, results and misfits of the realizations"""
+
+    database_filename: Path
+
+    def __init__(self, database_filename: Path):
+        """Opens or creates the ledger"""
+        self.database_filename = database_filename
+        with self.transaction() as connection:
+            for query in CREATE_TABLE_QUERIES:
+                connection.execute(query)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Connection holding the write lock, committed on success"""
+        # Like the work queue, the rollback journal is kept since WAL does not work on network shares
+        connection = sqlite3.connect(self.database_filename, timeout=DATABASE_TIMEOUT, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Connection for queries, which see the last committed realizations"""
+        connection = sqlite3.connect(self.database_filename, timeout=DATABASE_TIMEOUT)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def add_realization(
+        self,
+        model_name: str,
+        lithology_parameters: dict[str, dict[str, float]] = None,
+        heat_flow: float = None,
+        study: str = "",
+    ) -> int:
+        """Records the sampled parameters of a realization that starts running, by lithology, and returns its id"""
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO realizations (study, model_name, heat_flow, status, start_time) VALUES (?, ?, ?, ?, ?)",
+                (study, model_name, heat_flow, RUNNING, time.time()),
+            )
+            realization_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO parameters (realization_id, lithology, parameter, value) VALUES (?, ?, ?, ?)",
+                [
+                    (realization_id, lithology, parameter, float(value))
+                    for lithology, parameters in (lithology_parameters or {}).items()
+                    for parameter, value in parameters.items()
+                ],
+            )
+        return realization_id
+
+    def finish_realization(
+        self,
+        realization_id: int,
+        results_table: pd.DataFrame = None,
+        misfits: dict[str, float] = None,
+        error: str = None,
+    ) -> None:
+        """Records the outcome of a running realization, which failed if there is an error or a NaN misfit"""
+        misfits = {name: float(value) for name, value in (misfits or {}).items()}
+        if error is None:
+            nan_names = [name for name, value in misfits.items() if math.isnan(value)]
+            if len(nan_names) > 0:
+                error = f"Misfits {', '.join(nan_names)} are NaN"
+
+        with self.transaction() as connection:
+            # The outcome is only recorded once
+            cursor = connection.execute(
+                "UPDATE realizations SET status = ?, wall_time = ? - start_time, error = ? WHERE id = ? AND status = ?",
+                (DONE if error is None else FAILED, time.time(), error, realization_id, RUNNING),
+            )
+            if cursor.rowcount != 1:
+                raise LookupError(f"Realization {realization_id} is not running")
+
+            # A realization whose outcome cannot be stored is failed rather than left running, NaN is stored as NULL
+            connection.execute("SAVEPOINT outcome")
+            try:
+                connection.executemany(
+                    "INSERT INTO misfits (realization_id, name, value) VALUES (?, ?, ?)",
+                    [(realization_id, name, value) for name, value in misfits.items()],
+                )
+                if results_table is not None:
+                    connection.execute(
+                        "INSERT INTO results (realization_id, results_table) VALUES (?, ?)",
+                        (realization_id, RealizationLedger.serialize_table(results_table)),
+                    )
+                connection.execute("RELEASE outcome")
+            except Exception as outcome_error:
+                connection.execute("ROLLBACK TO outcome")
+                error = f"Outcome could not be recorded: {type(outcome_error).__name__}: {outcome_error}"
+                connection.execute(
+                    "UPDATE realizations SET status = ?, error = ? WHERE id = ?", (FAILED, error, realization_id)
+                )
+
+    @staticmethod
+    def get_filter(
+        study: str = None,
+        status: str = None,
+        model_name: str = None,
+        misfit_ranges: dict[str, tuple[float, float]] = None,
+        parameter_ranges: dict[tuple[str, str], tuple[float, float]] = None,
+    ) -> tuple[str, list]:
+        """Query of the ids of the realizations that match the filters, with its values"""
+        conditions = []
+        values = []
+        for column, value in [("study", study), ("status", status), ("model_name", model_name)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+
+        # Each range is answered by the value index of its table
+        for name, (low, high) in (misfit_ranges or {}).items():
+            conditions.append("id IN (SELECT realization_id FROM misfits WHERE name = ? AND value BETWEEN ? AND ?)")
+            values.extend([name, low, high])
+        for (lithology, parameter), (low, high) in (parameter_ranges or {}).items():
+            conditions.append(
+                "id IN (SELECT realization_id FROM parameters "
+                "WHERE lithology = ? AND parameter = ? AND value BETWEEN ? AND ?)"
+            )
+            values.extend([lithology, parameter, low, high])
+
+        query = "SELECT id FROM realizations"
+        if len(conditions) > 0:
+            query = query + " WHERE " + " AND ".join(conditions)
+        return query, values
+
+    def get_realizations(
+        self,
+        study: str = None,
+        status: str = None,
+        model_name: str = None,
+        misfit_ranges: dict[str, tuple[float, float]] = None,
+        parameter_ranges: dict[tuple[str, str], tuple[float, float]] = None,
+        best_misfit: str = None,
+        limit: int = None,
+    ) -> pd.DataFrame:
+        """Table of the realizations that match the filters, with a column per parameter and misfit
+
+        Ranges are inclusive and parameters are given by (lithology, parameter). If best_misfit is given,
+        the realizations are sorted by that misfit and only the ones that have it are returned.
+        """
+        filter_query, values = RealizationLedger.get_filter(
+            study, status, model_name, misfit_ranges, parameter_ranges
+        )
+        if best_misfit is None:
+            id_query = filter_query + " ORDER BY id"
+        else:
+            id_query = (
+                "SELECT realization_id FROM misfits WHERE name = ? AND value IS NOT NULL "
+                f"AND realization_id IN ({filter_query}) ORDER BY value, realization_id"
+            )
+            values = [best_misfit, *values]
+        if limit is not None:
+            id_query = id_query + f" LIMIT {int(limit)}"
+
+        with self.read() as connection:
+            # The selected ids keep the order of the query
+            connection.execute("CREATE TEMP TABLE selected_ids (position INTEGER PRIMARY KEY, id INTEGER)")
+            connection.execute(f"INSERT INTO selected_ids (id) {id_query}", values)
+            realizations_table = pd.read_sql_query(
+                "SELECT realizations.id, study, model_name, heat_flow, status, start_time, wall_time, error "
+                "FROM selected_ids JOIN realizations ON realizations.id = selected_ids.id ORDER BY position",
+                connection,
+                index_col="id",
+            )
+            parameters_table = pd.read_sql_query(
+                "SELECT realization_id, lithology, parameter, value FROM parameters "
+                "WHERE realization_id IN (SELECT id FROM selected_ids)",
+                connection,
+            )
+            misfits_table = pd.read_sql_query(
+                "SELECT realization_id, name, value FROM misfits WHERE realization_id IN (SELECT id FROM selected_ids)",
+                connection,
+            )
+
+        # Parameter columns are named like the sampled parameters, lithology_parameter
+        lithology_names = parameters_table["lithology"] + PARAMETER_NAME_SEPARATOR
+        parameters_table["name"] = lithology_names + parameters_table["parameter"]
+        parameters_table = parameters_table.pivot(index="realization_id", columns="name", values="value")
+        misfits_table = misfits_table.pivot(index="realization_id", columns="name", values="value")
+        misfits_table.columns = ["misfit" + PARAMETER_NAME_SEPARATOR + name for name in misfits_table.columns]
+        return realizations_table.join(parameters_table).join(misfits_table)
+
+    def get_results_table(self, realization_id: int) -> pd.DataFrame | None:
+        """Returns the extracted results of a realization, None if it has none"""
+        return self.get_results_tables([realization_id]).get(realization_id)
+
+    def get_results_tables(self, realization_ids: list[int]) -> dict[int, pd.DataFrame]:
+        """Returns the extracted results of several realizations, by id"""
+        results_tables = {}
+        with self.read() as connection:
+            for realization_id in realization_ids:
+                row = connection.execute(
+                    "SELECT results_table FROM results WHERE realization_id = ?", (realization_id,)
+                ).fetchone()
+                if row is not None:
+                    results_tables[realization_id] = RealizationLedger.deserialize_table(row[0])
+        return results_tables
+
+    @staticmethod
+    def serialize_table(results_table: pd.DataFrame) -> str:
+        """JSON of the index, columns and rows of a results table, readable by any pandas version unlike a pickle"""
+        # The json module writes floats exactly, to_json rounds them to 15 digits
+        return json.dumps(results_table.to_dict(orient="split"))
+
+    @staticmethod
+    def deserialize_table(serialized_table: str) -> pd.DataFrame:
+        """Results table of serialize_table, the column types come from the values"""
+        table_dict = json.loads(serialized_table)
+        return pd.DataFrame(table_dict["data"], index=table_dict["index"], columns=table_dict["columns"])
@@ -0,0 +1,183 @@
+from pathlib import Path
+import hashlib
+import os
+import pickle
+import subprocess
+import threading
+import pandas as pd
+from pydantic_xml import BaseXmlModel
+from auto_bpsm.file_formats.lithology_catalogue import LithologyCatalogue
+from auto_bpsm.file_formats.lithology_extras.litho import Lithology
+from auto_bpsm.opensim_utils.present_day_results import get_layer_data_table, get_model_output_signature
+from auto_bpsm.petromod_models import DEF_FILENAMES, IN_FILENAMES, OneDimensionalModel
+from auto_bpsm.petromod_project import PetroModProject
+from auto_bpsm.utilities import write_atomic
+
+DEFAULT_MAX_CACHE_SIZE = 1024**3
+CACHE_FILE_SUFFIX = ".pkl"
+
+
+def get_referenced_lithologies(model: OneDimensionalModel, lithology_catalogue: LithologyCatalogue) -> list[Lithology]:
+    """Returns the lithologies referenced by the deposition history, including mixing components"""
+    table_values = {str(value).strip() for value in model.depostion_history.table.values.ravel()}
+
+    lithologies = {id: entry[0] for id, entry in lithology_catalogue.index.lithologies_by_id.items()}
+
+    referenced_ids = [
+        lithology.id
+        for lithology in lithologies.values()
+        if {lithology.id, lithology.name, lithology.petromod_id} & table_values
+    ]
+
+    # Mixed lithologies depend on their components
+    found_lithologies = {}
+    while len(referenced_ids) > 0:
+        lithology_id = referenced_ids.pop()
+        if lithology_id in found_lithologies or lithology_id not in lithologies:
+            continue
+        lithology = lithologies[lithology_id]
+        found_lithologies[lithology_id] = lithology
+        if lithology.mixing is not None:
+            referenced_ids.extend([component.id for component in lithology.mixing.lithology_components])
+    return list(found_lithologies.values())
+
+
+def get_simulated_nodes(model: OneDimensionalModel, lithology_catalogue: LithologyCatalogue) -> list[BaseXmlModel]:
+    """Returns the lithologies a model uses and their curves, or the whole catalogue if none could be resolved"""
+    lithologies = get_referenced_lithologies(model, lithology_catalogue)
+    if len(lithologies) == 0:
+        return [lithology_catalogue]
+
+    nodes = []
+    for lithology in sorted(lithologies, key=lambda lithology: lithology.id):
+        nodes.append(lithology)
+        for parameter_group in lithology.parameter_groups:
+            for parameter in parameter_group.parameters:
+                if parameter.is_curve:
+                    curve, _curve_group = lithology_catalogue.get_curve(parameter.value)
+                    nodes.append(curve)
+    return nodes
+
+
+def get_simulation_fingerprint(
+    model: OneDimensionalModel,
+    lithology_catalogue: LithologyCatalogue,
+    layer_names: list[str] = None,
+) -> str:
+    """Hash of the model inputs, the lithologies they use and the extracted layers"""
+    fingerprint = hashlib.sha256()
+    for variable in [*IN_FILENAMES, *DEF_FILENAMES]:
+        petromod_file = getattr(model, variable)
+        if petromod_file is None:
+            continue
+        fingerprint.update(variable.encode("utf-8"))
+        fingerprint.update(petromod_file.to_string().encode("utf-8"))
+
+    for node in get_simulated_nodes(model, lithology_catalogue):
+        fingerprint.update(node.json().encode("utf-8"))
+
+    for layer_name in layer_names or []:
+        fingerprint.update(layer_name.encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+class SimulationResultCache:
+    """Size bounded disk cache of extracted results keyed by the simulation fingerprint"""
+
+    cache_folder: Path
+    max_size: int
+
+    def __init__(self, cache_folder: Path, max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        """Initializes the cache"""
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def get_filename(self, key: str) -> Path:
+        """Returns the file of a cache entry"""
+        return Path(self.cache_folder, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        """Returns the cached results or None"""
+        filename = self.get_filename(key)
+        try:
+            with open(filename, "rb") as f:
+                results_table = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # The modification time is the last access time for the eviction
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+        return results_table
+
+    def put(self, key: str, results_table: pd.DataFrame) -> None:
+        """Stores the results and evicts the least recently used entries"""
+        write_atomic(self.get_filename(key), pickle.dumps(results_table))
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_size"""
+        with self._lock:
+            entries = []
+            for filename in self.cache_folder.glob("*" + CACHE_FILE_SUFFIX):
+                try:
+                    file_stat = filename.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((file_stat.st_mtime_ns, file_stat.st_size, filename))
+            entries.sort()
+
+            cache_size = sum([entry[1] for entry in entries])
+            for _mtime, size, filename in entries:
+                if cache_size <= self.max_size:
+                    break
+                filename.unlink(missing_ok=True)
+                cache_size = cache_size - size
+
+    def clear(self) -> None:
+        """Removes all the entries"""
+        for filename in self.cache_folder.glob("*" + CACHE_FILE_SUFFIX):
+            filename.unlink(missing_ok=True)
+
+    def get_layer_data_table(
+        self,
+        project: PetroModProject,
+        model_name: str,
+        layer_names: list[str],
+        model: OneDimensionalModel = None,
+    ) -> pd.DataFrame:
+        """Returns cached results, or runs the saved model and extracts them on a miss"""
+        if model is None:
+            model = project.load_model(model_name)
+        lithology_catalogue = project.load_lithology()
+
+        # Hermes runs the files, so the fingerprint is only valid for saved inputs
+        if len(model.modified_variables) > 0:
+            raise ValueError(f"Model {model_name} has unsaved changes to {', '.join(model.modified_variables)}")
+        if not lithology_catalogue.is_saved(get_simulated_nodes(model, lithology_catalogue)):
+            raise ValueError(f"The lithologies of model {model_name} have unsaved changes")
+        key = get_simulation_fingerprint(model, lithology_catalogue, layer_names)
+
+        results_table = self.get(key)
+        if results_table is not None:
+            return results_table
+
+        # Failed runs are not cached, their outputs are the ones of a previous run
+        model_folder = project.get_model_folder(model_name)
+        if model_folder is None:
+            raise FileNotFoundError(f"Model {model_name} was not found")
+        command_result = project.petromod.execute_hermes(model_folder)
+        if command_result.return_code != 0:
+            raise subprocess.CalledProcessError(command_result.return_code, "hermes", command_result.log)
+        if len(get_model_output_signature(model_folder)) == 0:
+            raise FileNotFoundError(f"Model {model_name} has no output:\n{command_result.log}")
+
+        results_table = get_layer_data_table(project, model_name, layer_names)
+        if results_table.empty:
+            raise ValueError(f"No results were extracted for model {model_name}")
+        self.put(key, results_table)
+        return results_table
@@ -0,0 +1,128 @@
+from pathlib import Path
+import json
+import numpy as np
+import pandas as pd
+from auto_bpsm.utilities import write_atomic
+
+METADATA_FILENAME = "metadata.json"
+VALUES_FILENAME = "values.dat"
+FILLED_FILENAME = "filled.dat"
+DEFAULT_DEPTH_COLUMN = "Depth"
+# Properties are outermost so the realizations of a property are one contiguous block
+LAYOUT = "property_realization_depth"
+
+
+class ResultsCube:
+    """Memory mapped property x realization x depth array of ensemble results on a common depth grid"""
+
+    cube_folder: Path
+    depths: np.ndarray
+    properties: list[str]
+    depth_column: str
+    values: np.memmap
+    filled: np.memmap
+
+    def __init__(self, cube_folder: Path, read_only: bool = False):
+        """Opens a cube, the arrays are mapped so only the slices that are used are read"""
+        with open(Path(cube_folder, METADATA_FILENAME), "r") as f:
+            metadata = json.load(f)
+        if metadata.get("layout") != LAYOUT:
+            raise ValueError(f"The cube in {cube_folder} does not have the {LAYOUT} layout")
+        mode = "r" if read_only else "r+"
+        self.cube_folder = cube_folder
+        self.depths = np.array(metadata["depths"], dtype=float)
+        self.properties = metadata["properties"]
+        self.depth_column = metadata["depth_column"]
+        shape = (len(self.properties), metadata["realization_count"], len(self.depths))
+        self.values = np.memmap(Path(cube_folder, VALUES_FILENAME), dtype=metadata["dtype"], mode=mode, shape=shape)
+        self.filled = np.memmap(Path(cube_folder, FILLED_FILENAME), dtype=bool, mode=mode, shape=shape[1:2])
+
+    @staticmethod
+    def create(
+        cube_folder: Path,
+        realization_count: int,
+        depths,
+        properties: list[str],
+        depth_column: str = DEFAULT_DEPTH_COLUMN,
+        dtype: str = "float32",
+    ) -> "ResultsCube":
+        """Preallocates the files of a cube filled with NaN, the depths should be increasing"""
+        depths = np.array(depths, dtype=float)
+        if depths.ndim != 1 or np.any(np.diff(depths) <= 0):
+            raise ValueError("The depths should be one dimensional and increasing")
+        if not np.issubdtype(np.dtype(dtype), np.floating):
+            raise ValueError("The dtype should be a floating point type to hold NaN")
+        cube_folder.mkdir(parents=True, exist_ok=True)
+
+        # Realizations that were not written read as NaN rather than 0, one property at a time to bound the memory
+        shape = (len(properties), realization_count, len(depths))
+        values = np.memmap(Path(cube_folder, VALUES_FILENAME), dtype=dtype, mode="w+", shape=shape)
+        for property_values in values:
+            property_values[:] = np.nan
+        values.flush()
+        del values
+        np.memmap(Path(cube_folder, FILLED_FILENAME), dtype=bool, mode="w+", shape=shape[1:2]).flush()
+
+        metadata = {
+            "realization_count": realization_count,
+            "depths": depths.tolist(),
+            "properties": list(properties),
+            "depth_column": depth_column,
+            "dtype": np.dtype(dtype).name,
+            "layout": LAYOUT,
+        }
+        write_atomic(Path(cube_folder, METADATA_FILENAME), json.dumps(metadata, indent=2))
+        return ResultsCube(cube_folder)
+
+    @property
+    def realization_count(self) -> int:
+        """Number of realizations the cube holds"""
+        return self.values.shape[1]
+
+    def resample(self, results_table: pd.DataFrame) -> np.ndarray:
+        """Interpolates the properties of a results table on the depths, NaN outside of the table depths"""
+        table_depths = results_table[self.depth_column].to_numpy(dtype=float)
+        order = np.argsort(table_depths, kind="stable")
+        table_depths = table_depths[order]
+
+        resampled_values = np.empty((len(self.depths), len(self.properties)), dtype=float)
+        for i, property in enumerate(self.properties):
+            property_values = results_table[property].to_numpy(dtype=float)[order]
+            resampled_values[:, i] = np.interp(self.depths, table_depths, property_values, left=np.nan, right=np.nan)
+        return resampled_values
+
+    def write(self, realization_index: int, results_table: pd.DataFrame) -> None:
+        """Stores the results of a realization, writers of different realizations do not conflict"""
+        self.values[:, realization_index, :] = self.resample(results_table).T
+
+        # Marked last so a reader never sees a partly written realization as filled
+        self.filled[realization_index] = True
+
+    def flush(self) -> None:
+        """Writes the changes to disk"""
+        self.values.flush()
+        self.filled.flush()
+
+    def get_property_index(self, property: str) -> int:
+        """Index of a property on the first axis"""
+        if property not in self.properties:
+            raise LookupError(f"Property {property} was not found")
+        return self.properties.index(property)
+
+    def get_property(self, property: str) -> np.ndarray:
+        """Realization x depth view of a property, without copying, realizations that were not written are NaN"""
+        return self.values[self.get_property_index(property)]
+
+    def get_realization(self, realization_index: int) -> np.ndarray:
+        """Depth x property view of a realization, without copying, NaN if it was not written"""
+        return self.values[:, realization_index, :].T
+
+    def get_realization_table(self, realization_index: int) -> pd.DataFrame:
+        """Results of a realization on the depths as a table"""
+        realization_table = pd.DataFrame(self.get_realization(realization_index), columns=self.properties)
+        realization_table.insert(0, self.depth_column, self.depths)
+        return realization_table
+
+    def get_filled_indices(self) -> np.ndarray:
+        """Indices of the realizations that have results"""
+        return np.flatnonzero(self.filled)
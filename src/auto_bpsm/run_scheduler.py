@@ -0,0 +1,450 @@
+from concurrent.futures import CancelledError, Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Annotated, Literal
+import heapq
+import itertools
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from auto_bpsm.petromod_executables import CommandResult, PetroMod
+from auto_bpsm.petromod_project import PetroModProject, ValueRange
+from auto_bpsm.utilities import write_atomic
+
+RUNTIME_SMOOTHING = 0.3
+THROUGHPUT_TOLERANCE = 0.05
+MIN_LICENSE_BACKOFF = 5.0
+MAX_LICENSE_BACKOFF = 300.0
+DEFAULT_MAX_LICENSE_RETRIES = 10
+
+# FlexNet messages of a run that could not check out a license, only looked for in failed runs
+LICENSE_ERROR_PATTERN = re.compile(
+    r"FLEX(lm|net) Licensing error"
+    r"|licen[cs]e (checkout|check-out) failed"
+    r"|cannot connect to (the )?licen[cs]e server"
+    r"|licensed number of users already reached"
+    r"|no licen[cs]es? (is |are )?available",
+    re.IGNORECASE,
+)
+
+
+class RuntimeHistory:
+    """Exponentially smoothed runtimes of previous runs, by job key"""
+
+    runtimes: dict[str, float]
+
+    def __init__(self, runtimes: dict[str, float] = None):
+        """Initializes the history"""
+        self.runtimes = dict(runtimes or {})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_file(filename: Path) -> "RuntimeHistory":
+        """Reads a history, missing files give an empty history"""
+        if not filename.is_file():
+            return RuntimeHistory()
+        with open(filename, "r") as f:
+            return RuntimeHistory(json.load(f))
+
+    def write_file(self, filename: Path) -> None:
+        """Writes the history"""
+        with self._lock:
+            content = json.dumps(self.runtimes, indent=2)
+        write_atomic(filename, content)
+
+    def record(self, key: str, wall_time: float) -> None:
+        """Adds an observed runtime"""
+        with self._lock:
+            previous_runtime = self.runtimes.get(key)
+            if previous_runtime is None:
+                self.runtimes[key] = wall_time
+            else:
+                self.runtimes[key] = RUNTIME_SMOOTHING * wall_time + (1 - RUNTIME_SMOOTHING) * previous_runtime
+
+    def get_expected_runtime(self, key: str) -> float:
+        """Expected runtime of a job, the mean of all the jobs if it was never run"""
+        with self._lock:
+            if key in self.runtimes:
+                return self.runtimes[key]
+            if len(self.runtimes) == 0:
+                return 0.0
+            return sum(self.runtimes.values()) / len(self.runtimes)
+
+
+class ConcurrencyController:
+    """Number of concurrent runs, hill climbing on the measured throughput and halved on license errors"""
+
+    max_concurrency: int
+    concurrency: int
+    is_adaptive: bool
+
+    def __init__(self, max_concurrency: int, concurrency: int = 1, is_adaptive: bool = True):
+        """Initializes the controller"""
+        self.max_concurrency = max_concurrency
+        self.concurrency = min(max(concurrency, 1), max_concurrency)
+        self.is_adaptive = is_adaptive
+        self.direction = 1
+        self.previous_throughput = None
+        self.backoff = 0.0
+        self.backoff_until = 0.0
+        self.start_window()
+
+    def start_window(self) -> None:
+        """Starts measuring the throughput again"""
+        self.window_start = time.monotonic()
+        self.window_work = 0.0
+        self.window_runs = 0
+
+    def record_run(self, work: float, is_success: bool) -> None:
+        """Adds a finished run, the concurrency is adapted after as many runs as the concurrency"""
+        self.window_work = self.window_work + (work if is_success else 0.0)
+        self.window_runs = self.window_runs + 1
+        if is_success:
+            self.backoff = 0.0
+        if not self.is_adaptive or self.window_runs < self.concurrency:
+            return
+
+        # Keep going while the throughput does not drop, turn around otherwise
+        throughput = self.window_work / max(time.monotonic() - self.window_start, 1e-9)
+        if self.previous_throughput is not None and throughput < self.previous_throughput * (1 - THROUGHPUT_TOLERANCE):
+            self.direction = -self.direction
+        self.previous_throughput = throughput
+        self.concurrency = min(max(self.concurrency + self.direction, 1), self.max_concurrency)
+        if self.concurrency == 1:
+            self.direction = 1
+        elif self.concurrency == self.max_concurrency:
+            self.direction = -1
+        self.start_window()
+
+    def record_license_error(self) -> None:
+        """Halves the concurrency and pauses new runs for an increasing time"""
+        self.concurrency = max(self.concurrency // 2, 1)
+        self.direction = 1
+        self.previous_throughput = None
+        self.backoff = min(max(self.backoff * 2, MIN_LICENSE_BACKOFF), MAX_LICENSE_BACKOFF)
+        self.backoff_until = time.monotonic() + self.backoff
+        self.start_window()
+
+
+@dataclass
+class RunJob:
+    """A scheduled executable call"""
+
+    key: str
+    arguments: list[str]
+    working_folder: Path = None
+    priority: int = 0
+    timeout: float = None
+    max_retries: int = 0
+    tokens: int = 1
+    expected_runtime: float = 0.0
+    future: Future = field(default_factory=Future)
+    attempts: int = 0
+    license_attempts: int = 0
+    is_started: bool = False
+    is_cancelled: bool = False
+    process: subprocess.Popen = None
+
+
+class RunScheduler:
+    """Runs models and scripts by priority then longest expected runtime first, within a license token budget"""
+
+    project: PetroModProject
+    history: RuntimeHistory
+    history_filename: Path
+    controller: ConcurrencyController
+    license_tokens: int
+    license_error_pattern: re.Pattern
+
+    def __init__(
+        self,
+        project: PetroModProject,
+        max_workers: int = None,
+        history_filename: Path = None,
+        timeout: float = None,
+        max_retries: int = 0,
+        license_tokens: int = None,
+        adaptive: bool = True,
+        initial_concurrency: int = None,
+        license_error_pattern: re.Pattern | None = LICENSE_ERROR_PATTERN,
+        max_license_retries: int = DEFAULT_MAX_LICENSE_RETRIES,
+    ):
+        """Starts the workers, the concurrency adapts between one and max_workers unless adaptive is False"""
+        if max_workers is None:
+            max_workers = os.cpu_count()
+        if license_tokens is not None:
+            max_workers = min(max_workers, license_tokens)
+        if initial_concurrency is None:
+            initial_concurrency = max(max_workers // 2, 1) if adaptive else max_workers
+
+        self.project = project
+        self.history_filename = history_filename
+        self.history = RuntimeHistory.read_file(history_filename) if history_filename else RuntimeHistory()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.license_tokens = license_tokens
+        self.license_error_pattern = license_error_pattern
+        self.max_license_retries = max_license_retries
+        self.controller = ConcurrencyController(max_workers, initial_concurrency, adaptive)
+
+        self._queue: list[tuple[int, float, int, RunJob]] = []
+        self._jobs: dict[Future, RunJob] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._is_shutdown = False
+        self._running_jobs = 0
+        self._used_tokens = 0
+        self._workers = [threading.Thread(target=self.work, daemon=True) for _ in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "RunScheduler":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    @property
+    def concurrency(self) -> int:
+        """Returns the current number of allowed concurrent runs"""
+        return self.controller.concurrency
+
+    def submit_model(
+        self,
+        model_name: str,
+        priority: int = 0,
+        timeout: float = None,
+        max_retries: int = None,
+        tokens: int = 1,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ) -> Future:
+        """Schedules a model run, the future gives the CommandResult"""
+        model_folder = self.project.get_model_folder(model_name, model_dimension)
+        if model_folder is None:
+            raise FileNotFoundError(f"Model {model_name} was not found")
+        arguments = self.project.petromod.hermes_arguments(model_folder)
+        return self.submit(f"hermes|{model_folder.name}", arguments, None, priority, timeout, max_retries, tokens)
+
+    def submit_script(
+        self,
+        model_name: str,
+        script: Path | str,
+        script_folder_type: Literal["pmhome", "pmproj", "none"] = "none",
+        script_arguments: str | list[str] = "",
+        working_folder: Path = None,
+        priority: int = 0,
+        timeout: float = None,
+        max_retries: int = None,
+        tokens: int = 1,
+        model_dimension: Annotated[int, ValueRange(1, 3)] = None,
+    ) -> Future:
+        """Schedules a script call, the future gives the CommandResult"""
+        model_folder = self.project.get_model_folder(model_name, model_dimension)
+        if model_folder is None:
+            raise FileNotFoundError(f"Model {model_name} was not found")
+        arguments = self.project.petromod.pmpy_arguments(model_folder, script, script_folder_type, script_arguments)
+        key = f"pmpy|{model_folder.name}|{Path(script).name}"
+        return self.submit(key, arguments, working_folder, priority, timeout, max_retries, tokens)
+
+    def submit(
+        self,
+        key: str,
+        arguments: list[str],
+        working_folder: Path = None,
+        priority: int = 0,
+        timeout: float = None,
+        max_retries: int = None,
+        tokens: int = 1,
+    ) -> Future:
+        """Schedules an argument list, higher priorities run first"""
+        if self.license_tokens is not None and tokens > self.license_tokens:
+            raise ValueError(f"The job needs {tokens} tokens but only {self.license_tokens} are available")
+        job = RunJob(
+            key=key,
+            arguments=arguments,
+            working_folder=working_folder,
+            priority=priority,
+            timeout=self.timeout if timeout is None else timeout,
+            max_retries=self.max_retries if max_retries is None else max_retries,
+            tokens=tokens,
+            expected_runtime=self.history.get_expected_runtime(key),
+        )
+        with self._condition:
+            if self._is_shutdown:
+                raise RuntimeError("The scheduler was shut down")
+            self._jobs[job.future] = job
+            self.queue_job(job)
+        return job.future
+
+    def queue_job(self, job: RunJob) -> None:
+        """Adds a job to the queue, the condition should be held"""
+        heapq.heappush(self._queue, (-job.priority, -job.expected_runtime, next(self._counter), job))
+        self._condition.notify_all()
+
+    def cancel(self, future: Future) -> bool:
+        """Cancels a pending job, or kills a running one"""
+        with self._condition:
+            job = self._jobs.get(future)
+            if job is None or future.done():
+                return False
+            job.is_cancelled = True
+            if job.process is not None:
+                PetroMod.kill_process_tree(job.process.pid)
+
+            # Pending jobs are skipped by the workers
+            future.cancel()
+            self._condition.notify_all()
+        return True
+
+    def cancel_all(self) -> None:
+        """Cancels the pending jobs and kills the running ones"""
+        with self._condition:
+            futures = list(self._jobs)
+        for future in futures:
+            self.cancel(future)
+
+    def shutdown(self, wait: bool = True, cancel: bool = False) -> None:
+        """Stops the workers after the queued jobs, or cancels all the jobs first"""
+        with self._condition:
+            self._is_shutdown = True
+            self._condition.notify_all()
+        if cancel:
+            self.cancel_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        if self.history_filename:
+            self.history.write_file(self.history_filename)
+
+    def get_next_job(self) -> RunJob | None:
+        """Waits for a job that fits in the concurrency and the tokens, None once shut down and empty"""
+        with self._condition:
+            while True:
+                if len(self._queue) == 0:
+                    if self._is_shutdown and self._running_jobs == 0:
+                        return None
+                    self._condition.wait()
+                    continue
+
+                # Cancelled jobs are dropped without waiting for a slot
+                job = self._queue[0][3]
+                if job.is_cancelled:
+                    heapq.heappop(self._queue)
+                    self._jobs.pop(job.future, None)
+                    if job.is_started:
+                        job.future.set_exception(CancelledError())
+                    else:
+                        job.future.set_running_or_notify_cancel()
+                    continue
+
+                backoff_time = self.controller.backoff_until - time.monotonic()
+                if backoff_time > 0:
+                    self._condition.wait(backoff_time)
+                    continue
+                used_tokens = self._used_tokens + job.tokens
+                if self._running_jobs >= self.controller.concurrency or (
+                    self.license_tokens is not None and used_tokens > self.license_tokens
+                ):
+                    self._condition.wait()
+                    continue
+
+                heapq.heappop(self._queue)
+                if not job.is_started:
+                    if not job.future.set_running_or_notify_cancel():
+                        self._jobs.pop(job.future, None)
+                        continue
+                    job.is_started = True
+                self._running_jobs = self._running_jobs + 1
+                self._used_tokens = used_tokens
+                return job
+
+    def work(self) -> None:
+        """Runs jobs until the scheduler is shut down"""
+        while True:
+            job = self.get_next_job()
+            if job is None:
+                return
+            is_queued_again = False
+            try:
+                is_queued_again = self.run_job(job)
+            except Exception as error:
+                job.future.set_exception(error)
+            finally:
+                with self._condition:
+                    self._running_jobs = self._running_jobs - 1
+                    self._used_tokens = self._used_tokens - job.tokens
+                    if is_queued_again:
+                        self.queue_job(job)
+                    else:
+                        self._jobs.pop(job.future, None)
+                    self._condition.notify_all()
+
+    def run_job(self, job: RunJob) -> bool:
+        """Runs a job once and sets its result, returns True if it should be queued again"""
+        result, is_timed_out = self.run_process(job)
+        if job.is_cancelled:
+            job.future.set_exception(CancelledError())
+            return False
+
+        # License errors are waited out up to max_license_retries, they do not count as attempts
+        is_license_error = (
+            result.return_code != 0
+            and not is_timed_out
+            and self.license_error_pattern is not None
+            and self.license_error_pattern.search(result.log) is not None
+        )
+        if is_license_error:
+            with self._condition:
+                self.controller.record_license_error()
+            job.license_attempts = job.license_attempts + 1
+            if job.license_attempts <= self.max_license_retries:
+                return True
+            job.future.set_exception(subprocess.CalledProcessError(result.return_code, job.arguments, output=result.log))
+            return False
+
+        job.attempts = job.attempts + 1
+        is_success = result.return_code == 0 and not is_timed_out
+        with self._condition:
+            self.controller.record_run(job.expected_runtime or 1.0, is_success)
+        if is_success:
+            self.history.record(job.key, result.wall_time)
+            job.future.set_result(result)
+            return False
+        if job.attempts <= job.max_retries:
+            return True
+        if is_timed_out:
+            job.future.set_exception(subprocess.TimeoutExpired(job.arguments, job.timeout, output=result.log))
+        else:
+            job.future.set_exception(subprocess.CalledProcessError(result.return_code, job.arguments, output=result.log))
+        return False
+
+    def run_process(self, job: RunJob) -> tuple[CommandResult, bool]:
+        """Runs the job once, the process tree is killed when it times out"""
+        start_time = time.perf_counter()
+        process = PetroMod.start_process(job.arguments, self.project.petromod.environment, job.working_folder)
+        with self._condition:
+            job.process = process
+            if job.is_cancelled:
+                PetroMod.kill_process_tree(process.pid)
+
+        is_timed_out = False
+        try:
+            raw_log, _ = process.communicate(timeout=job.timeout)
+        except subprocess.TimeoutExpired:
+            is_timed_out = True
+            PetroMod.kill_process_tree(process.pid)
+            raw_log, _ = process.communicate()
+        except BaseException:
+            PetroMod.kill_process_tree(process.pid)
+            process.communicate()
+            raise
+        finally:
+            with self._condition:
+                job.process = None
+        wall_time = time.perf_counter() - start_time
+
+        log = (raw_log or "").removesuffix("\n")
+        return CommandResult(log=log, return_code=process.returncode, wall_time=wall_time), is_timed_out
@@ -0,0 +1,161 @@
+from collections.abc import Callable
+from pathlib import Path
+from typing import TypeVar
+import hashlib
+import os
+import pickle
+import stat
+import threading
+import warnings
+from auto_bpsm.utilities import write_atomic
+
+# Snapshots are unpickled, so they are kept in a folder only the user can write
+DEFAULT_SNAPSHOT_FOLDER = Path(
+    os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path(Path.home(), ".cache"),
+    "auto_bpsm",
+    "snapshots",
+)
+DEFAULT_MAX_SNAPSHOTS_SIZE = 1024**3
+SNAPSHOT_FILE_SUFFIX = ".pkl"
+
+T = TypeVar("T")
+
+
+class SnapshotCache:
+    """Size bounded pickled parsed files, reused while the source file keeps its modification time and size"""
+
+    snapshot_folder: Path
+    max_size: int
+    is_enabled: bool
+
+    def __init__(self, snapshot_folder: Path = DEFAULT_SNAPSHOT_FOLDER, max_size: int = DEFAULT_MAX_SNAPSHOTS_SIZE):
+        """Initializes the cache, the folder is created private to the user"""
+        self.snapshot_folder = snapshot_folder
+        self.max_size = max_size
+        self.is_enabled = True
+        self.snapshot_folder.mkdir(mode=0o700, parents=True, exist_ok=True)
+        SnapshotCache.check_folder(self.snapshot_folder)
+        self._lock = threading.Lock()
+
+        # Approximate size of the snapshots, the folder is only listed again when it goes over max_size
+        self._size = sum([size for _mtime, size, _filename in self.list_snapshots()])
+
+    @staticmethod
+    def create(snapshot_folder: Path | None, max_size: int = DEFAULT_MAX_SNAPSHOTS_SIZE) -> "SnapshotCache | None":
+        """Returns the cache of a folder, None if the folder is None or cannot be used"""
+        if snapshot_folder is None:
+            return None
+        try:
+            return SnapshotCache(Path(snapshot_folder), max_size)
+        except OSError as error:
+            warnings.warn(f"Snapshots are not cached, the folder {snapshot_folder} cannot be used: {error}")
+            return None
+
+    @staticmethod
+    def check_folder(snapshot_folder: Path) -> None:
+        """Makes sure other users cannot place snapshots in the folder"""
+        # Windows has no owner ids, the default folder is under the private application data there
+        if not hasattr(os, "getuid"):
+            return
+        folder_stat = os.stat(snapshot_folder)
+        if folder_stat.st_uid != os.getuid():
+            raise PermissionError(f"Snapshot folder {snapshot_folder} is not owned by the current user")
+        if stat.S_IMODE(folder_stat.st_mode) & 0o077 != 0:
+            os.chmod(snapshot_folder, 0o700)
+
+    def get_filename(self, filename: Path, variant: str = "") -> Path:
+        """Returns the snapshot file of a source file, one per source file and variant"""
+        key = hashlib.sha256(f"{Path(filename).resolve()}|{variant}".encode("utf-8")).hexdigest()
+        return Path(self.snapshot_folder, key + SNAPSHOT_FILE_SUFFIX)
+
+    @staticmethod
+    def get_signature(filename: Path) -> tuple[str, int, int]:
+        """Path, modification time and size of the source file"""
+        file_stat = os.stat(filename)
+        return str(Path(filename).resolve()), file_stat.st_mtime_ns, file_stat.st_size
+
+    def load(self, filename: Path, read_function: Callable[[Path], T], variant: str = "") -> T:
+        """Returns the snapshot of the file, or reads it and stores a snapshot if the file changed"""
+        if not self.is_enabled:
+            return read_function(filename)
+        signature = SnapshotCache.get_signature(filename)
+        snapshot_filename = self.get_filename(filename, variant)
+
+        # The signature is stored first so stale snapshots are not unpickled
+        try:
+            with open(snapshot_filename, "rb") as f:
+                if pickle.load(f) == signature:
+                    parsed_file = pickle.load(f)
+                    # The modification time is the last access time for the eviction
+                    os.utime(snapshot_filename)
+                    return parsed_file
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        # The cache is turned off rather than failing the read when the folder cannot be written
+        parsed_file = read_function(filename)
+        try:
+            self.save(filename, parsed_file, variant, signature)
+        except OSError as error:
+            self.is_enabled = False
+            warnings.warn(f"Snapshots are no longer cached in {self.snapshot_folder}: {error}")
+        return parsed_file
+
+    def save(self, filename: Path, parsed_file, variant: str = "", signature: tuple[str, int, int] = None) -> None:
+        """Stores the snapshot of a file and evicts the least recently used snapshots if the cache is full"""
+        if signature is None:
+            signature = SnapshotCache.get_signature(filename)
+        content = pickle.dumps(signature) + pickle.dumps(parsed_file, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(self.get_filename(filename, variant), content)
+        with self._lock:
+            self._size = self._size + len(content)
+            is_full = self._size > self.max_size
+        if is_full:
+            self.evict()
+
+    def list_snapshots(self) -> list[tuple[int, int, Path]]:
+        """Access time, size and filename of the snapshots, least recently used first"""
+        entries = []
+        for filename in self.snapshot_folder.glob("*" + SNAPSHOT_FILE_SUFFIX):
+            try:
+                file_stat = filename.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((file_stat.st_mtime_ns, file_stat.st_size, filename))
+        entries.sort()
+        return entries
+
+    def evict(self) -> None:
+        """Removes the least recently used snapshots until the cache fits in max_size"""
+        with self._lock:
+            entries = self.list_snapshots()
+            cache_size = sum([entry[1] for entry in entries])
+            for _mtime, size, filename in entries:
+                if cache_size <= self.max_size:
+                    break
+                filename.unlink(missing_ok=True)
+                cache_size = cache_size - size
+            self._size = cache_size
+
+    def prune(self, folder: Path = None) -> None:
+        """Removes the snapshots of source files that no longer exist, only the ones in the folder if given"""
+        folder = None if folder is None else Path(folder).resolve()
+        for snapshot_filename in self.snapshot_folder.glob("*" + SNAPSHOT_FILE_SUFFIX):
+            try:
+                with open(snapshot_filename, "rb") as f:
+                    source_filename = Path(pickle.load(f)[0])
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError, TypeError, IndexError):
+                # Snapshots without a readable signature can never be used
+                snapshot_filename.unlink(missing_ok=True)
+                continue
+            if folder is not None and folder not in source_filename.parents:
+                continue
+            if not source_filename.exists():
+                snapshot_filename.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """Removes all the snapshots"""
+        for filename in self.snapshot_folder.glob("*" + SNAPSHOT_FILE_SUFFIX):
+            filename.unlink(missing_ok=True)
+        with self._lock:
+            self._size = 0
@@ -1,9 +1,18 @@
+from collections.abc import Collection
+from pathlib import Path
+import errno
+import os
 import re
 import hashlib
+import shutil
+import tempfile
 from uuid import uuid4
 
+# Errors of file systems or volumes that do not allow the link, other errors are raised
+LINK_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK}
 
-def generate_new_id(existing_ids: list[str] = []):
+
+def generate_new_id(existing_ids: Collection[str] = ()):
     """New curve id"""
     is_unique = False
     while not is_unique:
@@ -13,6 +22,23 @@ def generate_new_id(existing_ids: list[str] = []):
     return new_id
 
 
+def link_or_copy(source_filename: Path, destination_filename: Path) -> None:
+    """Hardlinks a file, or copies it if the file system does not allow links, replacing the destination atomically"""
+    destination_filename = Path(destination_filename)
+    temporary_filename = Path(destination_filename.parent, f".{destination_filename.name}.{uuid4().hex}")
+    try:
+        try:
+            os.link(source_filename, temporary_filename)
+        except OSError as error:
+            if error.errno not in LINK_FALLBACK_ERRNOS:
+                raise
+            shutil.copy2(source_filename, temporary_filename)
+        os.replace(temporary_filename, destination_filename)
+    finally:
+        # Renaming a link over the same file leaves both names
+        temporary_filename.unlink(missing_ok=True)
+
+
 def is_md5(hash: str) -> bool:
     """Check if a string is md5"""
     pattern = "[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
@@ -78,3 +104,24 @@ def float_string_check(string: str) -> bool:
         return True
     except ValueError:
         return False
+
+
+def write_atomic(filename: Path, content: str | bytes, encoding: str = "utf-8") -> None:
+    """Writes to a temporary file next to the target and renames it over the target"""
+    filename = Path(filename)
+    file_descriptor, temporary_filename = tempfile.mkstemp(prefix=f".{filename.name}.", dir=filename.parent)
+    try:
+        if isinstance(content, str):
+            with open(file_descriptor, "w", encoding=encoding) as f:
+                f.write(content)
+        else:
+            with open(file_descriptor, "wb") as f:
+                f.write(content)
+        if filename.exists():
+            shutil.copymode(filename, temporary_filename)
+        else:
+            os.chmod(temporary_filename, 0o644)
+        os.replace(temporary_filename, filename)
+    except BaseException:
+        os.remove(temporary_filename)
+        raise
@@ -0,0 +1,292 @@
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+from auto_bpsm.opensim_utils.present_day_results import get_layer_data_table
+from auto_bpsm.petromod_project import PetroModProject
+
+DEFAULT_LEASE_TIME = 120.0
+DEFAULT_POLL_INTERVAL = 5.0
+DATABASE_TIMEOUT = 60.0
+HEARTBEAT_RETRIES_PER_LEASE = 12
+JOB_MODEL_SEPARATOR = "_job_"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+CREATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_name TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT
+)
+"""
+CREATE_INDEX_QUERY = "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)"
+
+
+@dataclass
+class WorkItem:
+    """A claimed job of the work queue"""
+
+    id: int
+    model_name: str
+    parameters: dict
+    attempts: int
+
+
+class WorkQueue:
+    """Jobs of an ensemble in a SQLite file, claimed with leases so several machines can share it"""
+
+    database_filename: Path
+
+    def __init__(self, database_filename: Path):
+        """Opens or creates the queue"""
+        self.database_filename = database_filename
+        with self.transaction() as connection:
+            connection.execute(CREATE_TABLE_QUERY)
+            connection.execute(CREATE_INDEX_QUERY)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Connection holding the write lock, committed on success"""
+        # A connection per transaction so threads and processes never share one, the rollback
+        # journal is kept since WAL does not work on network shares
+        connection = sqlite3.connect(self.database_filename, timeout=DATABASE_TIMEOUT, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def add_jobs(self, jobs: list[tuple[str, dict]], max_attempts: int = 1) -> list[int]:
+        """Adds (model name, parameters) jobs and returns their ids"""
+        ids = []
+        with self.transaction() as connection:
+            for model_name, parameters in jobs:
+                cursor = connection.execute(
+                    "INSERT INTO jobs (model_name, parameters, status, max_attempts) VALUES (?, ?, ?, ?)",
+                    (model_name, json.dumps(parameters or {}), PENDING, max_attempts),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> WorkItem | None:
+        """Takes the next pending job, or one whose lease expired, and returns None if there is none"""
+        now = time.time()
+        with self.transaction() as connection:
+            # Jobs of workers that stopped sending heartbeats are failed once out of attempts
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, "Lease expired", RUNNING, now),
+            )
+            row = connection.execute(
+                "SELECT id, model_name, parameters, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            id, model_name, parameters, attempts = row
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                (RUNNING, worker, now + lease_time, attempts + 1, id),
+            )
+        return WorkItem(id, model_name, json.loads(parameters), attempts + 1)
+
+    def heartbeat(self, id: int, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> bool:
+        """Extends the lease of a job, returns False if the worker lost it"""
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time() + lease_time, id, worker, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, id: int, worker: str, result=None) -> bool:
+        """Stores the result of a job, returns False if the worker lost the job"""
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result), id, worker, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, id: int, worker: str, error: str) -> bool:
+        """Returns a job to the queue, or fails it once out of attempts, returns False if the worker lost the job"""
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+                "error = ?, worker = NULL, lease_expires = NULL WHERE id = ? AND worker = ? AND status = ?",
+                (FAILED, PENDING, error, id, worker, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def reset_failed(self) -> int:
+        """Returns the failed jobs to the queue with fresh attempts"""
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, worker = NULL WHERE status = ?", (PENDING, FAILED)
+            )
+        return cursor.rowcount
+
+    def get_counts(self) -> dict[str, int]:
+        """Number of jobs by status"""
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self.transaction() as connection:
+            for status, count in connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+    def is_finished(self) -> bool:
+        """Checks if all the jobs are done or failed"""
+        counts = self.get_counts()
+        return counts[PENDING] == 0 and counts[RUNNING] == 0
+
+    def get_results(self) -> dict[int, tuple[str, dict, object]]:
+        """Model name, parameters and result of the jobs that are done, by id"""
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, model_name, parameters, result FROM jobs WHERE status = ? ORDER BY id", (DONE,)
+            ).fetchall()
+        return {
+            id: (model_name, json.loads(parameters), json.loads(result)) for id, model_name, parameters, result in rows
+        }
+
+    def get_errors(self) -> dict[int, str]:
+        """Errors of the jobs that failed, by id"""
+        with self.transaction() as connection:
+            rows = connection.execute("SELECT id, error FROM jobs WHERE status = ? ORDER BY id", (FAILED,)).fetchall()
+        return dict(rows)
+
+
+def run_model_job(project: PetroModProject, work_item: WorkItem) -> dict[str, list[float]] | None:
+    """Runs a job on its own copy of the model and extracts the layer_names of its parameters, if any
+
+    The lithologies parameter holds parameter values by parameter name by lithology, they are set on variants
+    of the lithologies that only the copy uses.
+    """
+    model_folder = project.get_model_folder(work_item.model_name)
+    if model_folder is None:
+        raise FileNotFoundError(f"Model {work_item.model_name} was not found")
+    model_dimension = int(str(model_folder.parent.name)[2])
+
+    # Jobs of the same model do not share a folder, the copy of an interrupted attempt is replaced
+    job_model_name = f"{work_item.model_name}{JOB_MODEL_SEPARATOR}{work_item.id}"
+    project.delete_model(job_model_name, model_dimension)
+
+    # The variants are written to the catalogue, so workers sharing a project folder need their own shard
+    lithology_parameters = work_item.parameters.get("lithologies") or {}
+    variants = {}
+    try:
+        if lithology_parameters:
+            variants = project.create_lithology_realizations(
+                work_item.model_name, [job_model_name], list(lithology_parameters), model_dimension
+            )
+            lithology_catalogue = project.load_lithology()
+            for (_lithology, variant), parameters in zip(variants[job_model_name], lithology_parameters.values()):
+                lithology_catalogue.update_lithology_parameter(variant, parameters)
+            project.save_lithology(incremental=True)
+        else:
+            project.duplicate_model(work_item.model_name, job_model_name, model_dimension, inputs_only=True)
+        project.run_model(job_model_name, model_dimension, check=True)
+
+        layer_names = work_item.parameters.get("layer_names")
+        if not layer_names:
+            return None
+        return get_layer_data_table(project, job_model_name, layer_names).to_dict(orient="list")
+    finally:
+        if variants:
+            project.delete_lithology_realizations(variants, model_dimension)
+        else:
+            project.delete_model(job_model_name, model_dimension)
+
+
+class QueueWorker:
+    """Claims jobs of a work queue and runs them, renewing the lease while a job runs"""
+
+    work_queue: WorkQueue
+    project: PetroModProject
+    worker: str
+
+    def __init__(
+        self,
+        work_queue: WorkQueue,
+        project: PetroModProject,
+        job_function: Callable[[PetroModProject, WorkItem], object] = run_model_job,
+        worker: str = None,
+        lease_time: float = DEFAULT_LEASE_TIME,
+    ):
+        """Initializes the worker, the name defaults to the host, process and a random suffix"""
+        if worker is None:
+            worker = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.work_queue = work_queue
+        self.project = project
+        self.job_function = job_function
+        self.worker = worker
+        self.lease_time = lease_time
+
+    def run(self, wait: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL, max_jobs: int = None) -> int:
+        """Runs jobs until the queue is empty, or until all jobs are finished if wait, and returns the count"""
+        job_count = 0
+        while max_jobs is None or job_count < max_jobs:
+            work_item = self.work_queue.claim(self.worker, self.lease_time)
+            if work_item is None:
+                # Jobs of other workers may come back if their lease expires
+                if not wait or self.work_queue.is_finished():
+                    break
+                time.sleep(poll_interval)
+                continue
+            self.run_job(work_item)
+            job_count = job_count + 1
+        return job_count
+
+    def run_job(self, work_item: WorkItem) -> bool:
+        """Runs a claimed job, returns False if it failed or the lease was lost"""
+        is_finished = threading.Event()
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats, args=(work_item, is_finished), daemon=True)
+        heartbeat_thread.start()
+        try:
+            result = self.job_function(self.project, work_item)
+        except Exception as error:
+            self.work_queue.fail(work_item.id, self.worker, f"{type(error).__name__}: {error}")
+            return False
+        finally:
+            is_finished.set()
+            heartbeat_thread.join()
+        return self.work_queue.complete(work_item.id, self.worker, result)
+
+    def send_heartbeats(self, work_item: WorkItem, is_finished: threading.Event) -> None:
+        """Extends the lease of a job until it finishes, three times per lease, retrying sooner if the database fails"""
+        interval = self.lease_time / 3
+        while not is_finished.wait(interval):
+            try:
+                if not self.work_queue.heartbeat(work_item.id, self.worker, self.lease_time):
+                    return
+            except sqlite3.OperationalError:
+                # A locked or unreachable database is retried, the job is only lost once the lease expires
+                interval = self.lease_time / HEARTBEAT_RETRIES_PER_LEASE
+                continue
+            interval = self.lease_time / 3